@@ -0,0 +1,37 @@
+import asyncio
+
+from .logger import logger
+
+
+class AssistantRegistry:
+    """Assistant of every conversation phase.
+
+    Chat turns only need assistant ids, which come from the environment, so
+    nothing here is on the request path. ``refresh`` checks that every
+    configured assistant exists and logs what it is (used by the warm-up).
+    """
+
+    def __init__(self, client, assistant_ids: dict):
+        self.client = client
+        self.assistant_ids = {phase: i for phase, i in assistant_ids.items() if i}
+
+    def __contains__(self, phase) -> bool:
+        return phase in self.assistant_ids
+
+    def id(self, phase: str) -> str:
+        return self.assistant_ids[phase]
+
+    async def _retrieve(self, assistant_id: str) -> dict:
+        assistant = await self.client.beta.assistants.retrieve(assistant_id=assistant_id)
+        return {
+            "id": assistant.id,
+            "name": assistant.name,
+            "model": assistant.model,
+            "tools": [tool.function.name if tool.type == "function" else tool.type for tool in assistant.tools],
+        }
+
+    async def refresh(self):
+        """Retrieve every configured assistant, failing if one of them does not exist."""
+        retrieved = await asyncio.gather(*(self._retrieve(i) for i in self.assistant_ids.values()))
+        names = ", ".join(f"{phase}={meta['name']}" for phase, meta in zip(self.assistant_ids, retrieved))
+        logger.info(f"Assistants found: {names}")
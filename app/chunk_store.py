@@ -0,0 +1,112 @@
+import mmap
+import os
+import pickle
+import struct
+import sys
+from pathlib import Path
+
+# On-disk layout of index.chunks (little-endian):
+#   8 bytes  magic b"CHUNKS01"
+#   8 bytes  uint64 n, number of chunk ids (max id + 1)
+#   8*(n+1)  int64 offsets into the blob; chunk i is blob[offsets[i]:offsets[i + 1]]
+#   ...      UTF-8 blob of every chunk text, concatenated
+# Ids missing from the original mapping are stored as empty ranges and treated as absent.
+MAGIC = b"CHUNKS01"
+HEADER = struct.Struct("<8sQ")
+CHUNKS_FILE = "index.chunks"
+PICKLE_FILE = "index.pkl"
+
+
+def write_chunk_store(path, id_to_text: dict):
+    """Write an id → text mapping as an index.chunks file (atomically)."""
+    path = Path(path)
+    count = max((int(i) for i in id_to_text), default=-1) + 1
+    offsets = [0] * (count + 1)
+    encoded = {int(i): text.encode("utf-8") for i, text in id_to_text.items()}
+
+    position = 0
+    for i in range(count):
+        position += len(encoded.get(i, b""))
+        offsets[i + 1] = position
+
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, count))
+        f.write(struct.pack(f"<{count + 1}q", *offsets))
+        for i in range(count):
+            f.write(encoded.get(i, b""))
+    os.replace(tmp_path, path)
+
+
+class ChunkStore:
+    """Read-only, memory-mapped id → text mapping.
+
+    Behaves like the ``id_to_text`` dicts it replaces (``store[i]``, ``i in store``,
+    ``len(store)``), but lookups are slices of the mapped file and nothing is
+    decoded until a chunk is actually read.
+    """
+
+    def __init__(self, path):
+        if sys.byteorder != "little":
+            raise RuntimeError("ChunkStore requires a little-endian platform")
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a chunk store")
+        self._count = count
+        view = memoryview(self._mmap)
+        offsets_end = HEADER.size + 8 * (count + 1)
+        self._offsets = view[HEADER.size:offsets_end].cast("q")
+        self._blob = view[offsets_end:]
+
+    def get_bytes(self, chunk_id) -> memoryview:
+        """Zero-copy UTF-8 bytes of a chunk."""
+        chunk_id = int(chunk_id)
+        if not 0 <= chunk_id < self._count:
+            raise KeyError(chunk_id)
+        start, end = self._offsets[chunk_id], self._offsets[chunk_id + 1]
+        if start == end:
+            raise KeyError(chunk_id)
+        return self._blob[start:end]
+
+    def __getitem__(self, chunk_id) -> str:
+        return str(self.get_bytes(chunk_id), "utf-8")
+
+    def get(self, chunk_id, default=None):
+        try:
+            return self[chunk_id]
+        except KeyError:
+            return default
+
+    def __contains__(self, chunk_id) -> bool:
+        chunk_id = int(chunk_id)
+        return 0 <= chunk_id < self._count and self._offsets[chunk_id] != self._offsets[chunk_id + 1]
+
+    def __len__(self) -> int:
+        return sum(1 for i in range(self._count) if self._offsets[i] != self._offsets[i + 1])
+
+    def keys(self):
+        return (i for i in range(self._count) if self._offsets[i] != self._offsets[i + 1])
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._mmap)
+
+
+def texts_path(index_dir) -> Path:
+    """The text mapping file of an index directory, preferring the chunk store."""
+    index_dir = Path(index_dir)
+    chunks_path = index_dir / CHUNKS_FILE
+    return chunks_path if chunks_path.exists() else index_dir / PICKLE_FILE
+
+
+def load_texts(index_dir):
+    """Open the id → text mapping of an index directory (chunk store or legacy pickle)."""
+    path = texts_path(index_dir)
+    if path.name == CHUNKS_FILE:
+        return ChunkStore(path)
+    with open(path, "rb") as f:
+        return pickle.load(f)
@@ -1,3 +1,4 @@
+import json
 import os
 from dotenv import load_dotenv
 
@@ -9,5 +10,64 @@ class Settings:
     FAISS_INDEX_ROOT="data/faiss_index"
     FAISS_DIRECTORY = "data/faiss_index"
     TEXT_MAPPING_PATH = "data/faiss_index/index.pkl"
+    ROUTER_REFRESH_SECONDS = float(os.getenv("ROUTER_REFRESH_SECONDS", 60))
+    ROUTER_MAX_DOCUMENTS = int(os.getenv("ROUTER_MAX_DOCUMENTS", 5))
+    MERGED_EF_SEARCH = int(os.getenv("MERGED_EF_SEARCH", 64))
+    MERGED_NPROBE = int(os.getenv("MERGED_NPROBE", 16))
+    MERGED_QUANTIZATION = os.getenv("MERGED_QUANTIZATION", "flat")  # flat, fp16, sq8 or pq
+    # Per-machine overrides, e.g. MERGED_QUANTIZATIONS='{"WLOL60H": "sq8"}'
+    MERGED_QUANTIZATIONS = json.loads(os.getenv("MERGED_QUANTIZATIONS", "{}"))
+    MERGED_MIN_RECALL = float(os.getenv("MERGED_MIN_RECALL", 0.9))  # recall@10 a quantized index must reach against its float32 counterpart
+    INDEX_CACHE_MAX_BYTES = int(os.getenv("INDEX_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+    EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "data/cache/embeddings.sqlite3")
+    EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 1024))
+    EMBEDDING_CACHE_DISK_SIZE = int(os.getenv("EMBEDDING_CACHE_DISK_SIZE", 100_000))  # least recently used rows beyond this are pruned
+    RUN_STREAMING = os.getenv("RUN_STREAMING", "true").lower() == "true"
+    RUN_TIMEOUT_SECONDS = float(os.getenv("RUN_TIMEOUT_SECONDS", 120))
+    RUN_POLL_MIN_SECONDS = float(os.getenv("RUN_POLL_MIN_SECONDS", 0.2))
+    RUN_POLL_MAX_SECONDS = float(os.getenv("RUN_POLL_MAX_SECONDS", 2))
+    TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", 20))
+    BACKEND_MAX_CONNECTIONS = int(os.getenv("BACKEND_MAX_CONNECTIONS", 20))
+    BACKEND_KEEPALIVE_SECONDS = float(os.getenv("BACKEND_KEEPALIVE_SECONDS", 30))
+    BACKEND_TIMEOUT_SECONDS = float(os.getenv("BACKEND_TIMEOUT_SECONDS", 10))
+    # Per-endpoint overrides, e.g. BACKEND_TIMEOUTS='{"tickets.add": 15}'
+    BACKEND_TIMEOUTS = {
+        "machines.find": 5,
+        "machines.find_by_model": 5,
+        **json.loads(os.getenv("BACKEND_TIMEOUTS", "{}")),
+    }
+    BACKEND_MAX_RETRIES = int(os.getenv("BACKEND_MAX_RETRIES", 2))
+    BACKEND_RETRY_BASE_SECONDS = float(os.getenv("BACKEND_RETRY_BASE_SECONDS", 0.2))
+    DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 1))
+    DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 10))
+    CONVERSATION_BATCH_SIZE = int(os.getenv("CONVERSATION_BATCH_SIZE", 200))
+    CONVERSATION_FLUSH_SECONDS = float(os.getenv("CONVERSATION_FLUSH_SECONDS", 1))
+    CONVERSATION_QUEUE_MAX = int(os.getenv("CONVERSATION_QUEUE_MAX", 10000))
+    CONVERSATION_SPILL_PATH = os.getenv("CONVERSATION_SPILL_PATH", "data/cache/conversations.pending.jsonl")
+    CONVERSATION_DEAD_LETTER_PATH = os.getenv("CONVERSATION_DEAD_LETTER_PATH", "data/cache/conversations.rejected.jsonl")
+
+    SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite")  # memory, sqlite or redis
+    SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", 7 * 24 * 3600))
+    SESSION_MEMORY_MAX_BYTES = int(os.getenv("SESSION_MEMORY_MAX_BYTES", 64 * 1024 * 1024))  # memory backend only
+    SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "data/cache/sessions.sqlite3")
+    SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+    SESSION_LOCK_TIMEOUT_SECONDS = float(os.getenv("SESSION_LOCK_TIMEOUT_SECONDS", 300))
+
+    WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+    WARMUP_RETRY_MAX_SECONDS = float(os.getenv("WARMUP_RETRY_MAX_SECONDS", 60))  # failed steps keep retrying, at most this far apart
+
+    YOLO_MAX_BATCH = int(os.getenv("YOLO_MAX_BATCH", 8))
+    YOLO_MAX_WAIT_MS = float(os.getenv("YOLO_MAX_WAIT_MS", 20))
+    YOLO_INPUT_SIZE = int(os.getenv("YOLO_INPUT_SIZE", 640))
+    YOLO_DECODE_MAX_SIDE = int(os.getenv("YOLO_DECODE_MAX_SIDE", 1280))  # annotations are drawn at this size
+    YOLO_IMAGE_MAX_BYTES = int(os.getenv("YOLO_IMAGE_MAX_BYTES", 20 * 1024 * 1024))
+    YOLO_DOWNLOAD_TIMEOUT_SECONDS = float(os.getenv("YOLO_DOWNLOAD_TIMEOUT_SECONDS", 15))
+    YOLO_RESULT_CACHE_SIZE = int(os.getenv("YOLO_RESULT_CACHE_SIZE", 256))
+
+    IMAGE_STORE_BACKEND = os.getenv("IMAGE_STORE_BACKEND", "cloudinary")  # cloudinary or local
+    IMAGE_STORE_LOCAL_DIR = os.getenv("IMAGE_STORE_LOCAL_DIR", "data/static/uploads")
+    IMAGE_STORE_LOCAL_URL = os.getenv("IMAGE_STORE_LOCAL_URL", "/static/uploads")
+    IMAGE_MANIFEST_PATH = os.getenv("IMAGE_MANIFEST_PATH", "data/static/image_manifest.json")
+    IMAGE_UPLOAD_WAIT_SECONDS = float(os.getenv("IMAGE_UPLOAD_WAIT_SECONDS", 10))
 
 settings = Settings()
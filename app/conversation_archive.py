@@ -0,0 +1,146 @@
+import asyncio
+import csv
+import io
+import json
+from datetime import datetime, timezone
+
+from .conversation_writer import COLUMNS
+
+EXPORT_COLUMNS = ["id"] + COLUMNS
+FORMATS = {"ndjson", "csv"}
+CURSOR_PREFETCH = 500
+COPY_QUEUE_CHUNKS = 8  # bounded, so a slow client slows COPY down instead of buffering
+IMPORT_BATCH_SIZE = 5000
+
+
+def build_filter(thread_id=None, start: datetime = None, end: datetime = None):
+    """WHERE clause and arguments for a thread and/or [start, end) date range."""
+    conditions, args = [], []
+    if thread_id is not None:
+        args.append(str(thread_id))
+        conditions.append(f"thread_id = ${len(args)}")
+    if start is not None:
+        args.append(start)
+        conditions.append(f'"timestamp" >= ${len(args)}')
+    if end is not None:
+        args.append(end)
+        conditions.append(f'"timestamp" < ${len(args)}')
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return where, args
+
+
+def export_query(where: str) -> str:
+    columns = ", ".join(f'"{c}"' for c in EXPORT_COLUMNS)
+    return f'SELECT {columns} FROM conversations {where} ORDER BY "timestamp", id'
+
+
+async def _copy_csv(conn, query, args):
+    """Stream COPY (query) TO STDOUT as CSV chunks."""
+    queue = asyncio.Queue(maxsize=COPY_QUEUE_CHUNKS)
+
+    async def output(chunk):
+        await queue.put(bytes(chunk))
+
+    async def run():
+        try:
+            await conn.copy_from_query(query, *args, output=output, format="csv", header=True)
+        finally:
+            await queue.put(None)
+
+    task = asyncio.create_task(run())
+    try:
+        while True:
+            chunk = await queue.get()
+            if chunk is None:
+                break
+            yield chunk
+        await task  # surface COPY errors
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+def _json_default(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+async def _cursor_ndjson(conn, query, args):
+    """Stream rows as NDJSON through a server-side cursor."""
+    async with conn.transaction():
+        async for record in conn.cursor(query, *args, prefetch=CURSOR_PREFETCH):
+            yield (json.dumps(dict(record), default=_json_default, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+async def export_conversations(pool, fmt: str, thread_id=None, start=None, end=None):
+    """Async generator of export bytes; holds one pooled connection while it runs."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}, expected one of {sorted(FORMATS)}")
+    where, args = build_filter(thread_id, start, end)
+    query = export_query(where)
+    async with pool.acquire() as conn:
+        stream = _copy_csv(conn, query, args) if fmt == "csv" else _cursor_ndjson(conn, query, args)
+        async for chunk in stream:
+            yield chunk
+
+
+def _parse_timestamp(value):
+    if value in (None, ""):
+        return datetime.now(timezone.utc)
+    return value if isinstance(value, datetime) else datetime.fromisoformat(value)
+
+
+def _to_record(row: dict):
+    ticket_id = row.get("ticket_id")
+    return (
+        str(row["thread_id"]),
+        int(ticket_id) if ticket_id not in (None, "") else None,
+        row["sender"],
+        row.get("message") or "",
+        row.get("media_url") or None,
+        _parse_timestamp(row.get("timestamp")),
+    )
+
+
+def iter_records(binary_file, fmt: str):
+    """Yield conversation records from an NDJSON or CSV export, one row at a time."""
+    text = io.TextIOWrapper(binary_file, encoding="utf-8", newline="")
+    if fmt == "csv":
+        for row in csv.DictReader(text):
+            yield _to_record(row)
+    elif fmt == "ndjson":
+        for line in text:
+            if line.strip():
+                yield _to_record(json.loads(line))
+    else:
+        raise ValueError(f"Unknown format {fmt!r}, expected one of {sorted(FORMATS)}")
+
+
+def iter_batches(binary_file, fmt: str, batch_size: int):
+    """Lists of up to ``batch_size`` records from an export."""
+    batch = []
+    for record in iter_records(binary_file, fmt):
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def import_conversations(pool, binary_file, fmt: str, batch_size: int = IMPORT_BATCH_SIZE) -> int:
+    """Bulk-load an export into conversations with COPY, in batches, in one transaction.
+
+    Reading and parsing each batch runs in a worker thread, so a large archive
+    does not block the event loop.
+    """
+    imported = 0
+    batches = iter_batches(binary_file, fmt, batch_size)
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            while True:
+                batch = await asyncio.to_thread(next, batches, None)
+                if batch is None:
+                    break
+                await conn.copy_records_to_table("conversations", records=batch, columns=COLUMNS)
+                imported += len(batch)
+    return imported
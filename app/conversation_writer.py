@@ -0,0 +1,273 @@
+import asyncio
+import glob
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+import asyncpg
+
+from .config import settings
+from .db import get_pool
+from .logger import logger
+
+COLUMNS = ["thread_id", "ticket_id", "sender", "message", "media_url", "timestamp"]
+
+# Errors that retrying the same rows cannot fix (bad values, constraint violations)
+PERMANENT_ERRORS = (asyncpg.DataError, asyncpg.IntegrityConstraintViolationError)
+
+
+def _process_alive(pid: int) -> bool:
+    if os.name != "posix":
+        return True  # no safe liveness probe; leave the file to its owner
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ConversationWriter:
+    """Write-behind queue for the conversations table.
+
+    Messages are queued without touching the database and written by a
+    background task in batches with COPY, whenever ``batch_size`` rows are
+    waiting or every ``flush_interval`` seconds. On shutdown the queue is
+    drained; rows that still cannot be written are spilled to a JSONL file
+    and replayed on the next start. Rows the database rejects outright are
+    isolated by bisecting the batch and moved to a dead-letter file, so they
+    never block the rows behind them.
+
+    Each process replays from its own file, claimed with an atomic rename, so
+    several uvicorn workers sharing the spill path never replay a row twice.
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float, max_queue: int, spill_path: str, dead_letter_path: str):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.spill_path = spill_path
+        self.dead_letter_path = dead_letter_path
+        self._queue = None
+        self._task = None
+        self._pending = []  # rows taken off the queue but not yet written
+        self._replay_remaining = 0  # leading pending rows that came from the spill file
+        self.written = 0
+        self.failed_flushes = 0
+        self.spilled = 0
+        self.dead_lettered = 0
+        self.last_flush_ms = None
+
+    async def start(self):
+        if self._task is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._pending = self._load_spill()
+        if self._pending:
+            logger.info(f"Replaying {len(self._pending)} spilled conversation messages")
+        self._task = asyncio.create_task(self._run())
+
+    def enqueue(self, msg):
+        """Queue a ConversationMessage for writing. Never blocks the caller."""
+        if not msg.message and not msg.media_url:
+            logger.debug("Skipping conversation message without message or media_url")
+            return
+        row = (
+            str(msg.thread_id),
+            msg.ticket_id,
+            msg.sender,
+            msg.message,
+            msg.media_url,
+            msg.timestamp or datetime.now(timezone.utc),
+        )
+        if self._queue is None:
+            # Writer not running (e.g. scripts): keep the row durable on disk
+            self._spill([row])
+            return
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            logger.error("Conversation queue full, spilling message to disk")
+            self._spill([row])
+
+    async def _run(self):
+        while True:
+            try:
+                await self._drain()
+            except asyncio.CancelledError:
+                return
+            except Exception:
+                # Pending rows are kept; a dead task would silently stop all writes
+                logger.exception("Conversation writer failed, restarting it")
+                await asyncio.sleep(self.flush_interval)
+
+    async def _drain(self):
+        while True:
+            deadline = time.monotonic() + self.flush_interval
+            while len(self._pending) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    self._pending.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            if self._pending and not await self._flush():
+                await asyncio.sleep(self.flush_interval)  # back off while the database is unavailable
+
+    async def _write(self, rows) -> int:
+        """COPY rows, bisecting around rows the database rejects and dead-lettering them.
+
+        Returns how many leading rows were dealt with (written or dead-lettered)
+        before a transient error; those after it stay pending.
+        """
+        try:
+            pool = await get_pool()
+            async with pool.acquire() as conn:
+                await conn.copy_records_to_table("conversations", records=rows, columns=COLUMNS)
+        except PERMANENT_ERRORS as e:
+            if len(rows) == 1:
+                logger.error(f"Conversation message rejected by the database, dead-lettering it: {str(e)}")
+                self._write_jsonl(self.dead_letter_path, rows, error=str(e))
+                self.dead_lettered += 1
+                return 1
+            mid = len(rows) // 2
+            handled = await self._write(rows[:mid])
+            if handled < mid:
+                return handled
+            return mid + await self._write(rows[mid:])
+        except Exception as e:
+            # Connection or timeout problems: rows stay pending and are retried on the next flush
+            logger.error(f"Error writing {len(rows)} conversation messages: {str(e)}")
+            return 0
+        self.written += len(rows)
+        return len(rows)
+
+    async def _flush(self) -> bool:
+        batch = self._pending[:self.batch_size]
+        started = time.perf_counter()
+        handled = await self._write(batch)
+        del self._pending[:handled]
+        if self._replay_remaining and handled:
+            self._replay_remaining = max(0, self._replay_remaining - handled)
+            if not self._replay_remaining:
+                self._remove(self._replay_path)
+        if handled < len(batch):
+            self.failed_flushes += 1
+            return False
+        self.last_flush_ms = round((time.perf_counter() - started) * 1000, 1)
+        return True
+
+    async def stop(self):
+        """Drain the queue and write everything; spill whatever cannot be written."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+        while not self._queue.empty():
+            self._pending.append(self._queue.get_nowait())
+        while self._pending:
+            if not await self._flush():
+                break
+        if self._pending:
+            self._spill(self._pending)
+            self._pending = []
+        if self._replay_remaining:
+            # Unwritten replayed rows were just spilled again
+            self._remove(self._replay_path)
+            self._replay_remaining = 0
+        self._queue = None
+
+    def _spill(self, rows):
+        self._write_jsonl(self.spill_path, rows)
+        self.spilled += len(rows)
+
+    @staticmethod
+    def _write_jsonl(path, rows, error=None):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            for row in rows:
+                record = dict(zip(COLUMNS, row))
+                record["timestamp"] = record["timestamp"].isoformat()
+                if error is not None:
+                    record["error"] = error
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    @property
+    def _replay_path(self):
+        return f"{self.spill_path}.{os.getpid()}.replay"
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _claim(self, path):
+        """Move the rows of a spill or replay file into this process's replay file.
+
+        The rename is atomic, so when several workers start at once exactly one
+        of them takes the file.
+        """
+        claim_path = f"{self.spill_path}.{os.getpid()}.claim"
+        try:
+            os.rename(path, claim_path)
+        except FileNotFoundError:
+            return  # another worker claimed it first
+        with open(claim_path, encoding="utf-8") as src, open(self._replay_path, "a", encoding="utf-8") as dst:
+            dst.write(src.read())
+        os.remove(claim_path)
+
+    def _orphaned_files(self):
+        """Replay/claim files of writer processes that are no longer running."""
+        prefix = self.spill_path + "."
+        for path in glob.glob(glob.escape(prefix) + "*"):
+            pid, _, kind = path[len(prefix):].partition(".")
+            if kind in ("replay", "claim") and pid.isdigit() and int(pid) != os.getpid() and not _process_alive(int(pid)):
+                yield path
+
+    def _load_spill(self):
+        """Rows left by an earlier run. The file is kept until those rows are written."""
+        # Pids are reused across restarts: a claim file under this pid was left by an interrupted claim
+        for path in [f"{self.spill_path}.{os.getpid()}.claim", self.spill_path, *self._orphaned_files()]:
+            if os.path.exists(path):
+                self._claim(path)
+        if not os.path.exists(self._replay_path):
+            return []
+
+        rows = []
+        with open(self._replay_path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    record["timestamp"] = datetime.fromisoformat(record["timestamp"])
+                    rows.append(tuple(record[c] for c in COLUMNS))
+        self._replay_remaining = len(rows)
+        if not rows:
+            self._remove(self._replay_path)
+        return rows
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "pending": len(self._pending),
+            "written": self.written,
+            "failed_flushes": self.failed_flushes,
+            "spilled": self.spilled,
+            "dead_lettered": self.dead_lettered,
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+
+conversation_writer = ConversationWriter(
+    batch_size=settings.CONVERSATION_BATCH_SIZE,
+    flush_interval=settings.CONVERSATION_FLUSH_SECONDS,
+    max_queue=settings.CONVERSATION_QUEUE_MAX,
+    spill_path=settings.CONVERSATION_SPILL_PATH,
+    dead_letter_path=settings.CONVERSATION_DEAD_LETTER_PATH,
+)
@@ -0,0 +1,40 @@
+import asyncio
+import os
+
+import asyncpg
+from dotenv import load_dotenv
+
+from .config import settings
+
+load_dotenv()
+
+DATABASE_PARAMS = {
+    "host": os.getenv("PGHOST"),
+    "database": os.getenv("PGDATABASE"),
+    "user": os.getenv("PGUSER"),
+    "password": os.getenv("PGPASSWORD"),
+}
+
+_pool = None
+_pool_lock = asyncio.Lock()
+
+
+async def get_pool() -> asyncpg.Pool:
+    """Shared connection pool, created on first use."""
+    global _pool
+    async with _pool_lock:
+        if _pool is None:
+            _pool = await asyncpg.create_pool(
+                **DATABASE_PARAMS,
+                min_size=settings.DB_POOL_MIN_SIZE,
+                max_size=settings.DB_POOL_MAX_SIZE,
+            )
+    return _pool
+
+
+async def close_pool():
+    global _pool
+    async with _pool_lock:
+        if _pool is not None:
+            await _pool.close()
+            _pool = None
@@ -0,0 +1,128 @@
+import math
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List
+
+from .logger import logger
+
+# Words that show up in almost every query and would route to unrelated documents
+STOPWORDS = {
+    "THE", "AND", "FOR", "WITH", "WHAT", "WHEN", "WHERE", "HOW", "WHY", "NOT",
+    "ARE", "DOES", "FROM", "THAT", "THIS", "HAS", "HAVE", "CAN", "ITS",
+}
+MIN_TOKEN_LENGTH = 3
+MIN_PREFIX_LENGTH = 4  # shorter query words only match whole folder tokens
+PREFIX_WEIGHT = 0.5
+
+
+def normalize_tokens(text: str) -> List[str]:
+    """Uppercase alphanumeric tokens of a query or folder name."""
+    text = unicodedata.normalize("NFKC", text).upper()
+    return [t for t in re.split(r"[^0-9A-Z]+", text) if len(t) >= MIN_TOKEN_LENGTH and t not in STOPWORDS]
+
+
+class MachineRoutes:
+    """Token lookup table for the per-document index folders of one machine."""
+
+    def __init__(self, machine_dir: Path):
+        self.machine_dir = machine_dir
+        self.mtime_ns = machine_dir.stat().st_mtime_ns if machine_dir.exists() else None
+        self.documents: List[Path] = []
+        self.postings: Dict[str, set] = defaultdict(set)  # token → document positions
+
+        if machine_dir.exists():
+            for subfolder in sorted(machine_dir.iterdir(), key=lambda p: p.name):
+                # Folders starting with "_" hold derived indexes (e.g. the merged one), not documents
+                if not subfolder.is_dir() or subfolder.name.startswith("_") or not (subfolder / "index.faiss").exists():
+                    continue
+                position = len(self.documents)
+                self.documents.append(subfolder)
+                name = unicodedata.normalize("NFKC", subfolder.name).upper()
+                tokens = set(normalize_tokens(name))
+                # The whole name as one token so that "64186-3" matches exactly
+                tokens.add(re.sub(r"[^0-9A-Z]+", "", name))
+                for token in tokens:
+                    if token:
+                        self.postings[token].add(position)
+
+        self.tokens = sorted(self.postings)
+
+    def _prefix_matches(self, word: str):
+        start = bisect_left(self.tokens, word)
+        for token in self.tokens[start:]:
+            if not token.startswith(word):
+                break
+            if token != word:
+                yield token
+
+    def route(self, query: str) -> List[Path]:
+        """Documents whose folder names match words of the query, best match first."""
+        total = len(self.documents)
+        scores = defaultdict(float)
+        for word in set(normalize_tokens(query)):
+            matches = [(word, 1.0)] if word in self.postings else []
+            if len(word) >= MIN_PREFIX_LENGTH:
+                matches.extend((token, PREFIX_WEIGHT) for token in self._prefix_matches(word))
+            for token, weight in matches:
+                postings = self.postings[token]
+                idf = math.log(1 + total / len(postings))
+                for position in postings:
+                    scores[position] += weight * idf
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], self.documents[item[0]].name))
+        return [self.documents[position] for position, _ in ranked]
+
+
+class DocumentRouter:
+    """Routes queries to per-document index folders without scanning the filesystem per request.
+
+    Tables are built once per machine and rebuilt when the machine directory's
+    mtime changes, checked at most every ``refresh_seconds``.
+    """
+
+    def __init__(self, root, refresh_seconds: float = 60):
+        self.root = Path(root)
+        self.refresh_seconds = refresh_seconds
+        self._routes: Dict[str, MachineRoutes] = {}
+        self._checked_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def build_all(self):
+        """Build the tables for every machine under the index root."""
+        if not self.root.exists():
+            return
+        for machine_dir in sorted(self.root.iterdir()):
+            if machine_dir.is_dir():
+                self._build(machine_dir.name)
+
+    def _build(self, machine_name: str) -> MachineRoutes:
+        routes = MachineRoutes(self.root / machine_name)
+        with self._lock:
+            self._routes[machine_name] = routes
+            self._checked_at[machine_name] = time.monotonic()
+        logger.info(f"Built document routes for {machine_name}: {len(routes.documents)} documents")
+        return routes
+
+    def _get(self, machine_name: str) -> MachineRoutes:
+        with self._lock:
+            routes = self._routes.get(machine_name)
+            checked_at = self._checked_at.get(machine_name, 0)
+        if routes is None:
+            return self._build(machine_name)
+
+        if time.monotonic() - checked_at >= self.refresh_seconds:
+            machine_dir = self.root / machine_name
+            mtime_ns = machine_dir.stat().st_mtime_ns if machine_dir.exists() else None
+            if mtime_ns != routes.mtime_ns:
+                return self._build(machine_name)
+            with self._lock:
+                self._checked_at[machine_name] = time.monotonic()
+        return routes
+
+    def route(self, machine_name: str, query: str) -> List[Path]:
+        return self._get(machine_name).route(query)
@@ -0,0 +1,101 @@
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Sequence
+
+import tiktoken
+
+from .logger import logger
+from .rate_limiter import RateLimiter
+
+# Limits of the embeddings endpoint
+MAX_INPUT_TOKENS = 8191
+MAX_BATCH_INPUTS = 2048
+MAX_BATCH_TOKENS = 300_000
+
+
+def pack_batches(token_counts: Sequence[int], max_tokens: int, max_inputs: int) -> List[List[int]]:
+    """Group input positions, in order, into batches within both per-request limits."""
+    batches, batch, batch_tokens = [], [], 0
+    for i, tokens in enumerate(token_counts):
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_inputs):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(i)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class EmbeddingBatcher:
+    """Embeds many texts in as few requests as the API allows.
+
+    Texts are measured with tiktoken and packed up to the per-request token and
+    input limits. A failed request is split in half and each half retried, so
+    only the input that actually fails is lost.
+    """
+
+    def __init__(
+        self,
+        embed: Callable[[List[str]], Awaitable[List[List[float]]]],
+        model: str,
+        limiter: Optional[RateLimiter] = None,
+        concurrency: int = 4,
+        max_batch_tokens: int = MAX_BATCH_TOKENS,
+        max_batch_inputs: int = MAX_BATCH_INPUTS,
+    ):
+        self.embed_texts = embed
+        self.encoding = tiktoken.encoding_for_model(model)
+        self.limiter = limiter
+        self.slots = asyncio.Semaphore(concurrency)
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_inputs = max_batch_inputs
+        self.requests = 0
+        self.splits = 0
+        self.failed = 0
+
+    def prepare(self, text: str):
+        """The text as sent (newlines flattened, truncated to the input limit) and its token count."""
+        text = text.replace("\n", " ")
+        tokens = self.encoding.encode(text, disallowed_special=())
+        if len(tokens) > MAX_INPUT_TOKENS:
+            tokens = tokens[:MAX_INPUT_TOKENS]
+            text = self.encoding.decode(tokens)
+        return text, len(tokens)
+
+    async def _embed(self, texts: List[str], token_counts: List[int]) -> List[Optional[List[float]]]:
+        try:
+            async with self.slots:
+                if self.limiter is not None:
+                    await self.limiter.acquire(sum(token_counts))
+                self.requests += 1
+                return await self.embed_texts(texts)
+        except Exception as e:
+            if len(texts) == 1:
+                self.failed += 1
+                logger.warning(f"Embedding failed for a {token_counts[0]}-token input: {str(e)}")
+                return [None]
+            self.splits += 1
+            mid = len(texts) // 2
+            left, right = await asyncio.gather(
+                self._embed(texts[:mid], token_counts[:mid]),
+                self._embed(texts[mid:], token_counts[mid:]),
+            )
+            return left + right
+
+    async def embed(self, texts: Sequence[str]):
+        """``(position, embedding)`` for every text that could be embedded, in order."""
+        prepared = await asyncio.to_thread(lambda: [self.prepare(t) for t in texts])
+        batches = pack_batches([n for _, n in prepared], self.max_batch_tokens, self.max_batch_inputs)
+        results = await asyncio.gather(*(
+            self._embed([prepared[i][0] for i in batch], [prepared[i][1] for i in batch])
+            for batch in batches
+        ))
+        return [
+            (i, embedding)
+            for batch, embeddings in zip(batches, results)
+            for i, embedding in zip(batch, embeddings)
+            if embedding is not None
+        ]
+
+    def stats(self) -> dict:
+        return {"requests": self.requests, "splits": self.splits, "failed": self.failed}
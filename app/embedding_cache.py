@@ -0,0 +1,156 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+
+from .config import settings
+from .logger import logger
+
+PRUNE_EVERY = 100  # puts between checks of the SQLite tier's size
+
+
+def normalize_query(text: str) -> str:
+    """Cache key form of a query: NFKC, lowercased, whitespace collapsed."""
+    return " ".join(unicodedata.normalize("NFKC", text).lower().split())
+
+
+class EmbeddingCache:
+    """Two-tier cache of query embeddings keyed by (model, normalized text).
+
+    The first tier is an in-memory LRU; the second is a SQLite file holding
+    float32 vectors, so a restarted process starts warm. Both tiers keep
+    float32; vectors become lists of floats only when returned. The SQLite
+    tier is pruned to its ``max_disk_entries`` most recently used rows.
+    """
+
+    def __init__(self, path: str, max_entries: int = 1024, max_disk_entries: int = 100_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()  # (model, key) → array("f")
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._db = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        if self._db is not None:
+            return self._db
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                key TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, key)
+            )
+        """)
+        db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._prune(db)
+        db.commit()
+        self._db = db
+
+        # Start warm: load the most recently used vectors into memory
+        rows = db.execute(
+            "SELECT model, key, vector FROM embeddings ORDER BY last_used DESC LIMIT ?",
+            (self.max_entries,),
+        ).fetchall()
+        for model, key, blob in reversed(rows):
+            self._memory[(model, key)] = array("f", blob)
+        logger.info(f"Embedding cache opened at {self.path} with {len(rows)} warm entries")
+        return db
+
+    def _prune(self, db):
+        """Delete the least recently used rows beyond ``max_disk_entries``."""
+        deleted = db.execute(
+            "DELETE FROM embeddings WHERE rowid IN "
+            "(SELECT rowid FROM embeddings ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,),
+        ).rowcount
+        if deleted:
+            logger.info(f"Pruned {deleted} least recently used embeddings from {self.path}")
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return hashlib.sha256(normalize_query(text).encode("utf-8")).hexdigest()
+
+    def _remember(self, cache_key, vector):
+        self._memory[cache_key] = vector
+        self._memory.move_to_end(cache_key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, model: str, text: str):
+        """Cached embedding for a query, or None."""
+        cache_key = (model, self._key(text))
+        with self._lock:
+            db = self._connect()
+            vector = self._memory.get(cache_key)
+            if vector is not None:
+                self._memory.move_to_end(cache_key)
+                self.memory_hits += 1
+                return vector.tolist()
+
+            row = db.execute(
+                "SELECT vector FROM embeddings WHERE model = ? AND key = ?", cache_key
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            db.execute(
+                "UPDATE embeddings SET last_used = ? WHERE model = ? AND key = ?",
+                (time.time(), *cache_key),
+            )
+            db.commit()
+            vector = array("f", row[0])
+            self._remember(cache_key, vector)
+            self.disk_hits += 1
+            return vector.tolist()
+
+    def put(self, model: str, text: str, vector):
+        cache_key = (model, self._key(text))
+        vector = array("f", vector)
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO embeddings (model, key, vector, last_used) VALUES (?, ?, ?, ?)",
+                (*cache_key, vector.tobytes(), time.time()),
+            )
+            self._puts += 1
+            if self._puts % PRUNE_EVERY == 0:
+                self._prune(db)
+            db.commit()
+            self._remember(cache_key, vector)
+
+    def get_or_compute(self, model: str, text: str, compute):
+        """Cached embedding for a query, calling ``compute(text)`` on a miss."""
+        vector = self.get(model, text)
+        if vector is None:
+            vector = compute(text)
+            self.put(model, text, vector)
+        return vector
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "max_disk_entries": self.max_disk_entries,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
+
+
+embedding_cache = EmbeddingCache(
+    settings.EMBEDDING_CACHE_PATH, settings.EMBEDDING_CACHE_SIZE, settings.EMBEDDING_CACHE_DISK_SIZE
+)
@@ -0,0 +1,92 @@
+import asyncio
+import random
+import time
+from collections import defaultdict
+
+import httpx
+
+from .config import settings
+from .logger import logger
+from .metrics import LatencyStats
+
+RETRY_STATUS_CODES = {502, 503, 504}
+
+
+class BackendClient:
+    """Shared, connection-pooled client for the machines and tickets backend APIs.
+
+    Every call names its endpoint, which selects its timeout and the bucket its
+    latency is recorded in. Only calls marked idempotent are retried, with
+    exponential backoff and full jitter.
+    """
+
+    def __init__(self):
+        self._client = None
+        self._stats = defaultdict(LatencyStats)
+        self.retries = defaultdict(int)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.BACKEND_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.BACKEND_MAX_CONNECTIONS,
+                    keepalive_expiry=settings.BACKEND_KEEPALIVE_SECONDS,
+                ),
+                timeout=settings.BACKEND_TIMEOUT_SECONDS,
+            )
+        return self._client
+
+    def timeout_for(self, endpoint: str) -> float:
+        return settings.BACKEND_TIMEOUTS.get(endpoint, settings.BACKEND_TIMEOUT_SECONDS)
+
+    def budget_for(self, endpoint: str, idempotent: bool = False) -> float:
+        """Longest a call may take: every attempt's timeout plus the longest backoffs between them."""
+        attempts = 1 + (settings.BACKEND_MAX_RETRIES if idempotent else 0)
+        backoff = sum(settings.BACKEND_RETRY_BASE_SECONDS * 2 ** attempt for attempt in range(attempts - 1))
+        return attempts * self.timeout_for(endpoint) + backoff
+
+    async def request(self, method: str, url: str, endpoint: str, idempotent: bool = False, **kwargs) -> httpx.Response:
+        attempts = 1 + (settings.BACKEND_MAX_RETRIES if idempotent else 0)
+        timeout = self.timeout_for(endpoint)
+
+        for attempt in range(attempts):
+            started = time.perf_counter()
+            try:
+                response = await self.client.request(method, url, timeout=timeout, **kwargs)
+            except httpx.TransportError as e:
+                self._stats[endpoint].observe(time.perf_counter() - started, error=True)
+                if attempt == attempts - 1:
+                    raise
+                logger.debug(f"{endpoint} failed ({e!r}), retrying")
+            else:
+                retryable = response.status_code in RETRY_STATUS_CODES
+                self._stats[endpoint].observe(time.perf_counter() - started, error=response.status_code >= 500)
+                if not retryable or attempt == attempts - 1:
+                    return response
+                logger.debug(f"{endpoint} returned {response.status_code}, retrying")
+
+            self.retries[endpoint] += 1
+            backoff = settings.BACKEND_RETRY_BASE_SECONDS * (2 ** attempt)
+            await asyncio.sleep(random.uniform(0, backoff))
+
+    async def post(self, url: str, endpoint: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, endpoint, **kwargs)
+
+    async def put(self, url: str, endpoint: str, **kwargs) -> httpx.Response:
+        return await self.request("PUT", url, endpoint, **kwargs)
+
+    def metrics(self) -> dict:
+        return {
+            endpoint: {**stats.snapshot(), "retries": self.retries[endpoint], "timeout_s": self.timeout_for(endpoint)}
+            for endpoint, stats in sorted(self._stats.items())
+        }
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+backend = BackendClient()
@@ -0,0 +1,133 @@
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import faiss
+
+from .chunk_store import load_texts, texts_path
+from .logger import logger
+
+
+def _file_signature(path: Path):
+    """(mtime_ns, size) of a file, used to detect on-disk changes."""
+    stat = path.stat()
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _vector_nbytes(index) -> int:
+    """Bytes held by the (possibly quantized) vectors of a FAISS index, plus its HNSW graph."""
+    graph_bytes = 0
+    if isinstance(index, faiss.IndexHNSW):
+        graph_bytes = 4 * int(index.hnsw.neighbors.size())
+        index = faiss.downcast_index(index.storage)
+    try:
+        code_size = index.sa_code_size()
+    except Exception:
+        code_size = index.d * 4  # float32 fallback
+    return int(code_size) * int(index.ntotal) + graph_bytes
+
+
+def load_index_dir(index_dir: Path):
+    """Read index.faiss and its text mapping (index.chunks, or legacy index.pkl) from an index directory."""
+    index_path = index_dir / "index.faiss"
+    mapping_path = texts_path(index_dir)
+
+    if not index_path.exists() or not mapping_path.exists():
+        raise FileNotFoundError(f"Index or mapping not found at {index_path} or {mapping_path}")
+
+    index = faiss.read_index(str(index_path))
+    id_to_text = load_texts(index_dir)
+    return index, id_to_text
+
+
+class IndexCache:
+    """Bounded LRU cache of loaded FAISS indexes, keyed by resolved index directory.
+
+    Entries are evicted least-recently-used first once the total vector bytes
+    exceed ``max_bytes``, and reloaded when the files on disk change.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key → (signature, index, id_to_text, nbytes)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _signature(self, index_dir: Path):
+        return (
+            _file_signature(index_dir / "index.faiss"),
+            _file_signature(texts_path(index_dir)),
+        )
+
+    def get(self, index_dir):
+        """Return (index, id_to_text) for an index directory, loading it on a miss."""
+        index_dir = Path(index_dir).resolve()
+        key = str(index_dir)
+        try:
+            signature = self._signature(index_dir)
+        except FileNotFoundError:
+            self.invalidate(index_dir)
+            raise FileNotFoundError(f"Index or mapping not found in {index_dir}")
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] == signature:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1], entry[2]
+                # Files changed on disk since we loaded them
+                self._drop(key)
+                self.invalidations += 1
+            self.misses += 1
+
+        logger.info(f"Loading FAISS index from {index_dir}...")
+        index, id_to_text = load_index_dir(index_dir)
+        nbytes = _vector_nbytes(index)
+
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (signature, index, id_to_text, nbytes)
+            self._total_bytes += nbytes
+            self._evict()
+        return index, id_to_text
+
+    def invalidate(self, index_dir=None):
+        """Drop one cached directory, or everything when no directory is given."""
+        with self._lock:
+            if index_dir is None:
+                self._entries.clear()
+                self._total_bytes = 0
+                return
+            key = str(Path(index_dir).resolve())
+            if key in self._entries:
+                self._drop(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._total_bytes -= entry[3]
+
+    def _evict(self):
+        # Always keep the most recent entry, even if it alone exceeds the budget
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key = next(iter(self._entries))
+            self._drop(key)
+            self.evictions += 1
+            logger.debug(f"Evicted FAISS index {key} from cache")
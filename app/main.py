@@ -1,7 +1,21 @@
+import asyncio
+import json
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-from .orchestrator import chat_with_assistant
+from .config import settings
+from .orchestrator import assistants, chat_events, chat_with_assistant
+from .conversation_writer import conversation_writer
+from .db import close_pool
+from .embedding_cache import embedding_cache
+from .http_client import backend
+from .session_store import session_store
+from .tools.rag_tool import vectorstore
+from .utils.image_manifest import get_manifest
+from .warmup import Warmup
+from .yolo.yolo_tool import annotation_uploads, get_models, inference
 from typing import Optional
 
 app = FastAPI()
@@ -14,6 +28,52 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.IMAGE_STORE_BACKEND == "local":
+    # Serve locally stored images, standing in for Cloudinary
+    app.mount(settings.IMAGE_STORE_LOCAL_URL, StaticFiles(directory=settings.IMAGE_STORE_LOCAL_DIR, check_dir=False))
+
+# Nothing slow happens at import or startup; these are loaded lazily or by the warm-up
+warmup = Warmup(retry_max_seconds=settings.WARMUP_RETRY_MAX_SECONDS)
+if settings.WARMUP_ENABLED:
+    # Only a sanity check: chat turns need nothing but the configured assistant ids
+    warmup.add("assistants", assistants.refresh, required=False)
+    warmup.add("yolo_models", lambda: asyncio.to_thread(get_models))
+    warmup.add("document_router", lambda: asyncio.to_thread(vectorstore.router.build_all))
+    warmup.add("image_manifest", lambda: asyncio.to_thread(get_manifest))
+
+@app.on_event("startup")
+async def startup():
+    await conversation_writer.start()
+    warmup.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await warmup.stop()
+    await inference.stop()
+    await annotation_uploads.stop()
+    await backend.aclose()
+    await conversation_writer.stop()
+    await close_pool()
+    await session_store.close()
+
+@app.get("/ready")
+async def ready():
+    """200 once the required warm-up steps finished, 503 while they are still loading or retrying."""
+    report = warmup.report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+@app.get("/metrics")
+async def metrics():
+    return {
+        "http": backend.metrics(),
+        "index_cache": vectorstore.index_cache.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "conversations": conversation_writer.stats(),
+        "sessions": await session_store.stats(),
+        "yolo": inference.stats(),
+        "annotation_uploads": annotation_uploads.stats(),
+    }
+
 class ChatRequest(BaseModel):
     user_id: int
     message: str
@@ -25,7 +85,7 @@ async def chat(req: ChatRequest):
     try:
         print("URL: ", req.media_url)
         print(req.message)
-        response, url = chat_with_assistant(user_id=req.user_id, message=req.message, reset=req.reset, file_url=req.media_url)
+        response, url = await chat_with_assistant(user_id=req.user_id, message=req.message, reset=req.reset, file_url=req.media_url)
         return {
             "response": response or "Desculpe, algo deu errado.",
             "image_url": url or None
@@ -33,3 +93,16 @@ async def chat(req: ChatRequest):
     except Exception as e:
         print(e)
         raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest):
+    """Same as /chat, but sends the reply as server-sent events while it is generated."""
+    async def event_source():
+        async for event in chat_events(user_id=req.user_id, message=req.message, reset=req.reset, file_url=req.media_url):
+            yield f"event: {event['event']}\ndata: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
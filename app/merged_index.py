@@ -0,0 +1,277 @@
+import json
+import math
+from bisect import bisect_right
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+from .chunk_store import CHUNKS_FILE, load_texts, texts_path, write_chunk_store
+from .config import settings
+from .logger import logger
+
+MERGED_DIR_NAME = "_merged"
+DOCUMENTS_FILE = "documents.json"
+
+HNSW_MAX_VECTORS = 200_000  # above this, IVF-Flat is cheaper to build and hold
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+IVF_TRAIN_POINTS_PER_LIST = 39  # FAISS warns below this
+EXACT_FILTER_MAX_IDS = 4096  # filters this small are scored exactly instead of via the ANN graph
+
+# How vectors are stored: float32 as embedded, float16 (2x smaller), 8-bit scalar
+# quantization (4x) or product quantization with one byte per PQ_DIMS_PER_CODE dims (16x)
+QUANTIZATIONS = ("flat", "fp16", "sq8", "pq")
+PQ_DIMS_PER_CODE = 4
+RECALL_K = 10
+RECALL_QUERIES = 200
+
+
+def shard_dirs(machine_dir: Path):
+    """Per-document index folders of a machine, in a stable order."""
+    return [
+        d for d in sorted(machine_dir.iterdir(), key=lambda p: p.name)
+        if d.is_dir() and not d.name.startswith("_") and (d / "index.faiss").exists() and texts_path(d).exists()
+    ]
+
+
+def quantization_for(machine_name: str) -> str:
+    """Configured vector storage of a machine's merged index (MERGED_QUANTIZATION[S])."""
+    return settings.MERGED_QUANTIZATIONS.get(machine_name, settings.MERGED_QUANTIZATION)
+
+
+def _pq_subquantizers(dim: int) -> int:
+    m = max(1, dim // PQ_DIMS_PER_CODE)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def choose_index(dim: int, count: int, quantization: str = "flat"):
+    """HNSW for small/medium corpora, IVF for large ones, storing vectors as ``quantization``."""
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization {quantization!r}, expected one of {', '.join(QUANTIZATIONS)}")
+    m = _pq_subquantizers(dim)
+    sq_types = {"fp16": faiss.ScalarQuantizer.QT_fp16, "sq8": faiss.ScalarQuantizer.QT_8bit}
+    storage = {"flat": "Flat", "fp16": "SQfp16", "sq8": "SQ8", "pq": f"PQ{m}"}[quantization]
+
+    if count <= HNSW_MAX_VECTORS:
+        if quantization == "flat":
+            index = faiss.IndexHNSWFlat(dim, HNSW_M)
+        elif quantization == "pq":
+            index = faiss.IndexHNSWPQ(dim, m, HNSW_M)
+        else:
+            index = faiss.IndexHNSWSQ(dim, sq_types[quantization], HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        return index, f"HNSW{HNSW_M},{storage}"
+
+    nlist = int(4 * math.sqrt(count))
+    nlist = max(1, min(nlist, count // IVF_TRAIN_POINTS_PER_LIST))
+    quantizer = faiss.IndexFlatL2(dim)
+    if quantization == "flat":
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+    elif quantization == "pq":
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, m, 8)
+    else:
+        index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, sq_types[quantization])
+    return index, f"IVF{nlist},{storage}"
+
+
+def recall_queries(matrix, count=RECALL_QUERIES):
+    """Query vectors near, but not on, indexed vectors.
+
+    Each sampled vector is moved by its distance to its nearest other vector in a
+    random direction, so a query never trivially finds itself.
+    """
+    rng = np.random.default_rng(0)
+    sample = matrix[rng.choice(len(matrix), size=min(count, len(matrix)), replace=False)]
+    if len(matrix) > 1:
+        distances, _ = faiss.knn(sample, matrix, 2)
+        radius = np.sqrt(np.maximum(distances[:, 1:2], 0))  # FAISS L2 distances are squared
+    else:
+        radius = np.ones((len(sample), 1), dtype="float32")
+    noise = rng.standard_normal(sample.shape).astype("float32")
+    noise *= radius / np.linalg.norm(noise, axis=1, keepdims=True)
+    return np.ascontiguousarray(sample + noise, dtype="float32")
+
+
+def _top_k(index, queries, k):
+    _, ids = index.search(queries, k, params=_search_params(index, settings.MERGED_EF_SEARCH, settings.MERGED_NPROBE))
+    return ids
+
+
+def _recall(truth, found) -> float:
+    """Mean fraction of each ``truth`` row found in the matching ``found`` row."""
+    hits = sum(len(set(t[t != -1]) & set(f)) for t, f in zip(truth, found))
+    total = sum(int((t != -1).sum()) for t in truth)
+    return hits / total if total else 1.0
+
+
+def _train_and_add(index, matrix):
+    if not index.is_trained:
+        index.train(matrix)
+    index.add(matrix)
+    if isinstance(index, faiss.IndexIVF):
+        index.make_direct_map()  # needed to score small document filters exactly
+
+
+def build_index(matrix, quantization: str, min_recall: float):
+    """Build the index for ``matrix``; a quantized variant is only kept if it reaches ``min_recall``.
+
+    The quantized index is judged against the float32 index of the same structure
+    (same HNSW or IVF layout), so only the error quantization adds is counted, not
+    the approximate search both share. Returns (index, description, quantization
+    actually used, recall figures).
+    """
+    dim, count = matrix.shape[1], matrix.shape[0]
+    k = min(RECALL_K, count)
+    queries = recall_queries(matrix)
+    _, exact = faiss.knn(queries, matrix, k)
+
+    reference, reference_description = choose_index(dim, count)
+    _train_and_add(reference, matrix)
+    reference_found = _top_k(reference, queries, k)
+    reference_recall = {f"recall@{RECALL_K}": round(_recall(exact, reference_found), 4)}
+    if quantization == "flat":
+        return reference, reference_description, "flat", reference_recall
+
+    index, description = choose_index(dim, count, quantization)
+    try:
+        _train_and_add(index, matrix)
+    except RuntimeError as e:  # e.g. too few vectors to train PQ codebooks
+        logger.warning(f"Could not build {description} ({str(e)}), keeping float32 vectors")
+        return reference, reference_description, "flat", reference_recall
+
+    found = _top_k(index, queries, k)
+    relative = _recall(reference_found, found)
+    if relative < min_recall:
+        logger.warning(
+            f"{description} recall@{RECALL_K} against {reference_description} is {relative:.3f} < {min_recall}, "
+            "keeping float32 vectors"
+        )
+        return reference, reference_description, "flat", reference_recall
+    return index, description, quantization, {
+        f"recall@{RECALL_K}": round(_recall(exact, found), 4),
+        f"recall@{RECALL_K}_vs_float32": round(relative, 4),
+    }
+
+
+def build_merged_index(machine_dir, quantization: str = None, min_recall: float = None):
+    """Merge every per-document shard of a machine into one ANN index.
+
+    Writes ``_merged/index.faiss``, ``_merged/index.chunks`` (chunk id → text)
+    and ``_merged/documents.json`` with the chunk id range of every document.
+    ``quantization`` defaults to the machine's configured one.
+    """
+    machine_dir = Path(machine_dir)
+    quantization = quantization or quantization_for(machine_dir.name)
+    min_recall = settings.MERGED_MIN_RECALL if min_recall is None else min_recall
+    vectors, id_to_text, documents = [], {}, []
+    next_id = 0
+
+    for shard_dir in shard_dirs(machine_dir):
+        shard = faiss.read_index(str(shard_dir / "index.faiss"))
+        shard_texts = load_texts(shard_dir)
+        if shard.ntotal == 0:
+            continue
+
+        vectors.append(shard.reconstruct_n(0, shard.ntotal))
+        for local_id in range(shard.ntotal):
+            if local_id in shard_texts:
+                id_to_text[next_id + local_id] = shard_texts[local_id]
+        documents.append({"name": shard_dir.name, "start": next_id, "count": shard.ntotal})
+        next_id += shard.ntotal
+
+    if not documents:
+        raise FileNotFoundError(f"No per-document shards found under {machine_dir}")
+
+    matrix = np.ascontiguousarray(np.vstack(vectors), dtype="float32")
+    index, description, quantization, recall = build_index(matrix, quantization, min_recall)
+
+    merged_dir = machine_dir / MERGED_DIR_NAME
+    merged_dir.mkdir(exist_ok=True)
+    faiss.write_index(index, str(merged_dir / "index.faiss"))
+    write_chunk_store(merged_dir / CHUNKS_FILE, id_to_text)
+    with open(merged_dir / DOCUMENTS_FILE, "w", encoding="utf-8") as f:
+        json.dump({
+            "index_type": description,
+            "quantization": quantization,
+            **recall,
+            "dimension": int(matrix.shape[1]),
+            "count": int(matrix.shape[0]),
+            "built_at": datetime.now(timezone.utc).isoformat(),
+            "documents": documents,
+        }, f, ensure_ascii=False, indent=2)
+
+    logger.info(
+        f"Merged {len(documents)} documents ({matrix.shape[0]} chunks) into {description} at {merged_dir}"
+        f" ({', '.join(f'{name} {value:.3f}' for name, value in recall.items())})"
+    )
+    return merged_dir
+
+
+class DocumentMap:
+    """Chunk id ↔ (document, chunk) mapping of a merged index."""
+
+    def __init__(self, meta: dict):
+        self.meta = meta
+        self.documents = meta["documents"]
+        self.starts = [d["start"] for d in self.documents]
+        self.by_name = {d["name"]: d for d in self.documents}
+
+    def locate(self, chunk_id: int):
+        """(document name, chunk number within that document) for a merged chunk id."""
+        position = bisect_right(self.starts, chunk_id) - 1
+        document = self.documents[position]
+        return document["name"], chunk_id - document["start"]
+
+    def ids_for(self, names):
+        ranges = [self.by_name[n] for n in names if n in self.by_name]
+        if not ranges:
+            return np.empty(0, dtype="int64")
+        return np.concatenate([np.arange(d["start"], d["start"] + d["count"], dtype="int64") for d in ranges])
+
+
+@lru_cache(maxsize=32)
+def _read_document_map(path: str, mtime_ns: int) -> DocumentMap:
+    with open(path, encoding="utf-8") as f:
+        return DocumentMap(json.load(f))
+
+
+def read_document_map(merged_dir) -> DocumentMap:
+    path = Path(merged_dir) / DOCUMENTS_FILE
+    return _read_document_map(str(path), path.stat().st_mtime_ns)
+
+
+def _search_params(index, ef_search: int, nprobe: int, selector=None):
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=ef_search)
+    return faiss.SearchParameters(sel=selector) if selector is not None else None
+
+
+def search_merged(index, document_map: DocumentMap, query_vector, k, documents=None, ef_search=64, nprobe=16):
+    """Search a merged index, optionally restricted to some documents.
+
+    Returns a list of (distance, chunk id), closest first.
+    """
+    if documents:
+        ids = document_map.ids_for(documents)
+        if len(ids) == 0:
+            return []
+        if len(ids) <= EXACT_FILTER_MAX_IDS:
+            # Few candidates: score them exactly rather than hoping the graph reaches them
+            candidates = index.reconstruct_batch(ids)
+            distances = ((candidates - query_vector[0]) ** 2).sum(axis=1)
+            order = np.argsort(distances)[:k]
+            return [(float(distances[i]), int(ids[i])) for i in order]
+        params = _search_params(index, ef_search, nprobe, faiss.IDSelectorBatch(ids))
+    else:
+        params = _search_params(index, ef_search, nprobe)
+
+    D, I = index.search(query_vector, k, params=params)
+    return [(float(d), int(i)) for d, i in zip(D[0], I[0]) if i != -1]
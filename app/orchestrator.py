@@ -1,25 +1,34 @@
+import asyncio
 import openai
-import time
 import json
 import os
 import requests
-from app.utils.replace_image_placeholders import process_text_return_image_url
-import uuid
+from app.utils.replace_image_placeholders import (
+    ImageDirectory,
+    PlaceholderStreamFilter,
+    process_text_return_image_url,
+    resolve_image_placeholder,
+)
 from datetime import datetime, timezone
-from typing import Dict, List, Tuple
+from typing import Dict, List
+from openai.types.beta.threads import Run
 from app.tools.rag_tool import search_manuals
 from app.tools.report_tool import create_ticket, edit_ticket, solve_ticket
 from app.tools.info_tool import match_model, match_serial_number, create_machine
-from app.yolo.yolo_tool import detect_yolo
+from app.yolo.yolo_tool import annotation_uploads, detect_yolo_async
 from app.utils import replace_image_placeholders
-import time
+from .assistant_registry import AssistantRegistry
+from .config import settings
+from .http_client import backend
 from .logger import logger
-from .routes import ConversationMessage, add_conversation
+from .conversation_writer import conversation_writer
+from .session_store import new_session, session_store
+from .routes import ConversationMessage
 
 CLOUDINARY_URL = "https://api.cloudinary.com/v1_1/dn8rj0auz/image/upload"
 UPLOAD_PRESET = "sugar-2025"
 
-client = openai.OpenAI()
+client = openai.AsyncOpenAI()
 
 assistant_ids = {
     "info": os.getenv("INFO_ASSISTANT_ID"),
@@ -27,16 +36,7 @@ assistant_ids = {
     "solve": os.getenv("SOLVE_ASSISTANT_ID"),
 }
 
-assistants = {
-    phase: client.beta.assistants.retrieve(assistant_id=assistant_id)
-    for phase, assistant_id in assistant_ids.items()
-    if assistant_id is not None
-}
-
-user_threads = {}
-user_info = {}
-tickets_info = {}
-custom_thread_id = {}
+assistants = AssistantRegistry(client, assistant_ids)
 
 tool_function_map = {
     "match_model": match_model,
@@ -48,190 +48,515 @@ tool_function_map = {
     "edit_ticket": edit_ticket
 }
 
-def handle_tool_calls(tool_calls, user_id) -> Tuple[List[Dict], List[str]]:
-    outputs = []
-    processed_ids = set()  # Set to track processed tool call IDs
+# Progress messages shown to the user while a tool runs
+TOOL_PROGRESS_MESSAGES = {
+    "match_model": "Checking machine model…",
+    "match_serial_number": "Checking serial number…",
+    "create_machine": "Registering machine…",
+    "search_manuals": "Searching manuals…",
+    "create_ticket": "Creating ticket…",
+    "edit_ticket": "Updating ticket…",
+    "solve_ticket": "Closing ticket…",
+}
 
-    for tool_call in tool_calls:
-        tool_name = tool_call.function.name
-        args = json.loads(tool_call.function.arguments)
+IMAGE_DIR = "data/static/images"
+
+# State each tool reads and writes: (reads, writes). Calls whose accesses conflict
+# run in the order the assistant requested them; everything else runs concurrently.
+TOOL_STATE_ACCESS = {
+    "match_model": ({"user_info"}, {"user_info"}),
+    "match_serial_number": ({"user_info"}, {"user_info"}),
+    "create_machine": ({"user_info"}, {"user_info"}),
+    "search_manuals": ({"user_info"}, set()),
+    "create_ticket": ({"user_info"}, {"tickets_info"}),
+    "edit_ticket": ({"tickets_info"}, {"tickets_info"}),
+    "solve_ticket": ({"tickets_info"}, {"tickets_info"}),
+}
+
+# Per-tool timeouts in seconds; backend tools derive theirs from TOOL_BACKEND_CALLS,
+# others use settings.TOOL_TIMEOUT_SECONDS
+TOOL_TIMEOUTS = {
+    "search_manuals": 30,
+}
 
-        # Skip processing if this tool_call_id has already been processed
-        if tool_call.id in processed_ids:
-            continue  # Avoid processing duplicate tool call
+# Backend calls each tool makes, as (endpoint, idempotent); see BackendClient.budget_for
+TOOL_BACKEND_CALLS = {
+    "match_model": [("machines.find_by_model", True)],
+    "match_serial_number": [("machines.find", True)],
+    "edit_ticket": [("tickets.edit", True)],
+    "solve_ticket": [("tickets.resolve", True)],
+}
+TOOL_TIMEOUT_MARGIN_SECONDS = 2
+
+# Tools that create a record are never cancelled: the record could exist without the
+# session ever learning its id. Their single backend call is bounded by its own timeout,
+# after which the tool reports the outcome as unknown.
+NON_IDEMPOTENT_TOOLS = {"create_machine", "create_ticket"}
+
+def tool_timeout(tool_name) -> float:
+    if tool_name in TOOL_TIMEOUTS:
+        return TOOL_TIMEOUTS[tool_name]
+    calls = TOOL_BACKEND_CALLS.get(tool_name)
+    if not calls:
+        return settings.TOOL_TIMEOUT_SECONDS
+    return sum(backend.budget_for(endpoint, idempotent) for endpoint, idempotent in calls) + TOOL_TIMEOUT_MARGIN_SECONDS
+
+async def call_tool(tool_name, **kwargs):
+    """Run a tool with its timeout. Async tools are awaited; blocking ones (FAISS search, embeddings) run in a worker thread."""
+    func = tool_function_map[tool_name]
+    if asyncio.iscoroutinefunction(func):
+        call = func(**kwargs)
+    else:
+        call = asyncio.to_thread(func, **kwargs)
+    if tool_name in NON_IDEMPOTENT_TOOLS:
+        return await call
+    timeout = tool_timeout(tool_name)
+    try:
+        return await asyncio.wait_for(call, timeout=timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"{tool_name} timed out after {timeout:g}s")
+
+async def run_tool_call(tool_call, session, emit=None) -> Dict:
+    """Run one tool call and update the user's session from its result. Returns its tool output."""
+    user_id = session["user_id"]
+    user_info = session["user_info"]
+    tickets_info = session["tickets_info"]
+    tool_name = tool_call.function.name
+    args = json.loads(tool_call.function.arguments)
+
+    if emit:
+        await emit("tool", {
+            "name": tool_name,
+            "status": "started",
+            "message": TOOL_PROGRESS_MESSAGES.get(tool_name, f"Running {tool_name}…"),
+        })
 
-        # Add the tool call id to the processed set
-        processed_ids.add(tool_call.id)
+    try:
+        # Check if the tool_name is in the map of tool functions
+        if tool_name not in tool_function_map:
+            print(f"Unknown tool: {tool_name}")  # Debug log
+            return {"tool_call_id": tool_call.id, "output": f"Unknown tool {tool_name}"}
 
         try:
-            # Check if the tool_name is in the map of tool functions
-            if tool_name not in tool_function_map:
-                print(f"Unknown tool: {tool_name}")  # Debug log
-                outputs.append({"tool_call_id": tool_call.id, "output": f"Unknown tool {tool_name}"})
-                continue
+            # Processing tool calls based on the tool_name
+            if tool_name == "search_manuals":
+                try:
+                    args.setdefault("machine_name", user_info.get("model_name") or "DEFAULT")
+                    result = await call_tool(
+                        tool_name,
+                        query=args.get("query", "default query"),
+                        machine_name=args["machine_name"]
+                    )
+                except Exception as e:
+                    print(f"Error in search_manuals: {str(e)}")  # Log error
+                    result = {"error": f"Error in search manuals: {str(e)}"}
+
+                docs = result.get("documents", [])
+                if docs:
+                    docs_text = "\n\n".join(docs)
+                    result = (
+                        f"\n\nThe knowledge base returned the following documents:\n\n{docs_text}\n\n"
+                        "Please use this information to answer the user's question."
+                    )
+            else:
+                # Inject user_id where necessary for other tool calls
+                if tool_name in ["match_model", "match_serial_number", "create_machine"]:
+                    args["user_id"] = user_id
+                if tool_name == "create_ticket":
+                    args["machine_id"] = user_info["machine_id"]
+                if tool_name in ["solve_ticket", "edit_ticket"]:
+                    if "ticket_id" not in tickets_info:
+                        raise ValueError(f"Tickets information for user {user_id} not found.")
+                    args["ticket_id"] = tickets_info["ticket_id"]
 
-            try:
-                # Processing tool calls based on the tool_name
-                if tool_name == "search_manuals":
-                    try:
-                        args.setdefault("machine_name", user_info[user_id].get("model_name", "DEFAULT"))
-                        result = tool_function_map[tool_name](
-                            query=args.get("query", "default query"),
-                            machine_name=args["machine_name"]
-                        )
-                    except Exception as e:
-                        print(f"Error in search_manuals: {str(e)}")  # Log error
-                        result = {"error": f"Error in search manuals: {str(e)}"}
+                try:
+                    result = await call_tool(tool_name, **args)
+                except Exception as e:
+                    print(f"Error in calling {tool_name}: {str(e)}")  # Log error
+                    result = {"error": f"Error in calling tool {tool_name}: {str(e)}"}
 
-                    docs = result.get("documents", [])
-                    if docs:
-                        docs_text = "\n\n".join(docs)
+            # Store user data when available based on tool_name
+            try:
+                if tool_name == "match_model":
+                    user_info["model_name"] = result.get("model_name")
+                    possible_serials = result.get("related_serial_numbers")
+                    if possible_serials:
+                        serials_list = ", ".join(possible_serials)
                         result = (
-                            f"\n\nThe knowledge base returned the following documents:\n\n{docs_text}\n\n"
-                            "Please use this information to answer the user's question."
+                            f"\n\nThe found serial numbers for that model are: {serials_list}. "
+                            "Check if the serial number is one of those."
                         )
-                else:
-                    # Inject user_id where necessary for other tool calls
-                    if tool_name in ["match_model", "match_serial_number", "create_machine"]:
-                        args["user_id"] = user_id
-                    if tool_name == "create_ticket":
-                        args["machine_id"] = user_info[user_id]["machine_id"]
-                    if tool_name in ["solve_ticket", "edit_ticket"]:
-                        if user_id not in tickets_info:
-                            raise ValueError(f"Tickets information for user {user_id} not found.")
-                        args["ticket_id"] = tickets_info[user_id]["ticket_id"]
 
+                elif tool_name == "match_serial_number":
+                    user_info["serial_number"] = result.get("serial_number")
+                    machine_data = result.get("data", {})
+                    user_info.update({
+                        "machine_id": machine_data.get("machine_id"),
+                        "model_name": machine_data.get("machine_model"),
+                        "serial_number": machine_data.get("machine_number"),
+                    })
+                elif tool_name == "create_machine" and result.get("outcome") != "unknown":
+                    machine_data = result.get("data", {})
+                    user_info.update({
+                        "machine_id": machine_data.get("machine_id"),
+                        "user_id": machine_data.get("user_id"),
+                        "model_name": machine_data.get("model"),
+                        "serial_number": machine_data.get("serial_number"),
+                    })
+                elif tool_name in ["edit_ticket"]:
+                    ticket_data = result.get("ticket", {})
+                    tickets_info.update({
+                        "ticket_id": ticket_data.get("ticket_id"),
+                        "machine_id": ticket_data.get("machine_id"),
+                        "title": ticket_data.get("title"),
+                        "description": ticket_data.get("description"),
+                        "resolved": ticket_data.get("resolved")
+                    })
+                elif tool_name == "create_ticket" and result.get("outcome") != "unknown":
+              
                     try:
-                        result = tool_function_map[tool_name](**args)
-                    except Exception as e:
-                        print(f"Error in calling {tool_name}: {str(e)}")  # Log error
-                        result = {"error": f"Error in calling tool {tool_name}: {str(e)}"}
-
-                # Store user data when available based on tool_name
-                try:
-                    if user_id not in user_info:
-                        raise ValueError(f"User info for user_id {user_id} is missing.")
-                    
-                    if tool_name == "match_model":
-                        user_info[user_id]["model_name"] = result.get("model_name")
-                        possible_serials = result.get("related_serial_numbers")
-                        if possible_serials:
-                            serials_list = ", ".join(possible_serials)
-                            result = (
-                                f"\n\nThe found serial numbers for that model are: {serials_list}. "
-                                "Check if the serial number is one of those."
-                            )
-
-                    elif tool_name == "match_serial_number":
-                        user_info[user_id]["serial_number"] = result.get("serial_number")
-                        machine_data = result.get("data", {})
-                        user_info[user_id].update({
-                            "machine_id": machine_data.get("machine_id"),
-                            "model_name": machine_data.get("machine_model"),
-                            "serial_number": machine_data.get("machine_number"),
-                        })
-                    elif tool_name == "create_machine":
-                        machine_data = result.get("data", {})
-                        user_info[user_id].update({
-                            "machine_id": machine_data.get("machine_id"),
-                            "user_id": machine_data.get("user_id"),
-                            "model_name": machine_data.get("model"),
-                            "serial_number": machine_data.get("serial_number"),
-                        })
-                    elif tool_name in ["edit_ticket"]:
-                        ticket_data = result.get("ticket", {})
-                        if user_id not in tickets_info:
-                            tickets_info[user_id] = {}
-                        tickets_info[user_id].update({
-                            "ticket_id": ticket_data.get("ticket_id"),
-                            "machine_id": ticket_data.get("machine_id"),
-                            "title": ticket_data.get("title"),
-                            "description": ticket_data.get("description"),
-                            "resolved": ticket_data.get("resolved")
-                        })
-                    elif tool_name == "create_ticket":
-                  
-                        try:
-                            ticket_data = result.get("ticket", {})
-                            
-                            # Debugging: Log the result and data to inspect what's being returned
-                            print(f"Received ticket data: {ticket_data}")  # Log the ticket data
-
-                            # Check if ticket data contains all necessary fields before updating
-                            if "ticket_id" in ticket_data and "machine_id" in ticket_data and "title" in ticket_data and "description" in ticket_data:
-                                if user_id not in tickets_info:
-                                    tickets_info[user_id] = {}
-                                tickets_info[user_id].update({
-                                    "ticket_id": ticket_data.get("ticket_id"),
-                                    "machine_id": ticket_data.get("machine_id"),
-                                    "title": ticket_data.get("title"),
-                                    "description": ticket_data.get("description"),
-                                    "resolved": ticket_data.get("resolved", False)  # Default to False if not provided
-                                })
-                            else:
-                                raise ValueError("Missing required fields in ticket data")
-                            
-                        except Exception as e:
-                            print(f"Error while storing ticket data for {user_id}: {str(e)}")  # Log specific error for create_ticket
-                            outputs.append({"tool_call_id": tool_call.id, "output": f"Error in creating ticket: {str(e)}"})
-
-                    elif tool_name == "solve_ticket":
                         ticket_data = result.get("ticket", {})
-                        if user_id not in tickets_info:
-                            tickets_info[user_id] = {}
-                        tickets_info[user_id].update({
-                            "resolved": ticket_data.get("resolved")
-                        })
+                        
+                        # Debugging: Log the result and data to inspect what's being returned
+                        print(f"Received ticket data: {ticket_data}")  # Log the ticket data
+
+                        # Check if ticket data contains all necessary fields before updating
+                        if "ticket_id" in ticket_data and "machine_id" in ticket_data and "title" in ticket_data and "description" in ticket_data:
+                            tickets_info.update({
+                                "ticket_id": ticket_data.get("ticket_id"),
+                                "machine_id": ticket_data.get("machine_id"),
+                                "title": ticket_data.get("title"),
+                                "description": ticket_data.get("description"),
+                                "resolved": ticket_data.get("resolved", False)  # Default to False if not provided
+                            })
+                        else:
+                            raise ValueError("Missing required fields in ticket data")
+                        
+                    except Exception as e:
+                        print(f"Error while storing ticket data for {user_id}: {str(e)}")  # Log specific error for create_ticket
+                        result = f"Error in creating ticket: {str(e)}"
 
-                except Exception as e:
-                    print(f"Error in storing user data for {tool_name}: {str(e)}")  # Log error
+                elif tool_name == "solve_ticket":
+                    ticket_data = result.get("ticket", {})
+                    tickets_info.update({
+                        "resolved": ticket_data.get("resolved")
+                    })
 
             except Exception as e:
-                print(f"General error in processing tool call {tool_name}: {str(e)}")  # Log any unexpected errors
-                result = {"error": f"General error processing tool call: {str(e)}"}
-
-            # Append result
-            outputs.append({"tool_call_id": tool_call.id, "output": json.dumps(result)})
+                print(f"Error in storing user data for {tool_name}: {str(e)}")  # Log error
 
         except Exception as e:
-            print(f"Exception while processing tool call {tool_call.id}: {str(e)}")  # Log outer exception
-            outputs.append({"tool_call_id": tool_call.id, "output": f"Error: {str(e)}"})
+            print(f"General error in processing tool call {tool_name}: {str(e)}")  # Log any unexpected errors
+            result = {"error": f"General error processing tool call: {str(e)}"}
 
-    return outputs
+        if emit:
+            await emit("tool", {"name": tool_name, "status": "finished"})
+        return {"tool_call_id": tool_call.id, "output": json.dumps(result)}
 
-def get_or_create_thread(user_id: str, reset: bool):
-    if user_id not in user_threads:
-        user_threads[user_id] = {"phase": "info", "threads": {}}
-    if reset or "object" not in user_threads[user_id]["threads"]:
-        thread = client.beta.threads.create()
-        user_threads[user_id]["phase"] = "info"
-        user_threads[user_id]["threads"]["object"] = thread
-        user_threads[user_id]["threads"]["basic_info"] = False
+    except Exception as e:
+        print(f"Exception while processing tool call {tool_call.id}: {str(e)}")  # Log outer exception
+        return {"tool_call_id": tool_call.id, "output": f"Error: {str(e)}"}
+
+def tools_conflict(first: str, second: str) -> bool:
+    """Whether two tools touch the same state in a way that makes their order matter."""
+    reads_a, writes_a = TOOL_STATE_ACCESS.get(first, (set(), set()))
+    reads_b, writes_b = TOOL_STATE_ACCESS.get(second, (set(), set()))
+    return bool(writes_a & (reads_b | writes_b) or writes_b & reads_a)
+
+async def handle_tool_calls(tool_calls, session, emit=None) -> List[Dict]:
+    """Run the tool calls of one round concurrently.
+
+    A call waits only for earlier calls it conflicts with (see TOOL_STATE_ACCESS),
+    so e.g. search_manuals and edit_ticket overlap while create_ticket still
+    finishes before edit_ticket. Outputs are returned in the original order.
+    """
+    unique_calls = []
+    processed_ids = set()  # Set to track processed tool call IDs
+    for tool_call in tool_calls:
+        # Skip duplicate tool calls
+        if tool_call.id not in processed_ids:
+            processed_ids.add(tool_call.id)
+            unique_calls.append(tool_call)
+
+    async def run_after(dependencies, tool_call):
+        if dependencies:
+            await asyncio.wait(dependencies)
+        return await run_tool_call(tool_call, session, emit=emit)
+
+    tasks = []
+    for position, tool_call in enumerate(unique_calls):
+        dependencies = [
+            tasks[earlier] for earlier, other in enumerate(unique_calls[:position])
+            if tools_conflict(other.function.name, tool_call.function.name)
+        ]
+        tasks.append(asyncio.create_task(run_after(dependencies, tool_call)))
+
+    return list(await asyncio.gather(*tasks))
+
+RUN_TERMINAL_STATUSES = {"completed", "failed", "incomplete", "cancelled", "expired"}
+
+class RunTimeout(Exception):
+    """The run did not finish before its deadline."""
+
+async def next_event(events, deadline: float):
+    """The next event of a run stream, or None once it ends; raises RunTimeout past the deadline."""
+    remaining = deadline - asyncio.get_running_loop().time()
+    if remaining <= 0:
+        raise RunTimeout()
+    try:
+        return await asyncio.wait_for(events.__anext__(), timeout=remaining)
+    except StopAsyncIteration:
+        return None
+    except asyncio.TimeoutError:
+        raise RunTimeout()
+
+async def stream_run(thread_id: str, assistant_id: str, session, run_state: dict, deadline: float, emit=None, **run_kwargs):
+    """Drive a run through the streaming API, answering tool calls as soon as they are requested.
+
+    Text deltas are forwarded to ``emit`` as "message_start" / "text_delta" events.
+    The deadline is only checked while waiting for events, never while tools run,
+    so a tool that creates a record is not cancelled halfway.
+    """
+    stream = await client.beta.threads.runs.create(
+        thread_id=thread_id,
+        assistant_id=assistant_id,
+        stream=True,
+        **run_kwargs
+    )
+    while stream is not None:
+        outputs = None
+        events = stream.__aiter__()
+        try:
+            while True:
+                event = await next_event(events, deadline)
+                if event is None:
+                    break
+                # Run-level events only: thread.run.step.* events carry RunStep objects, not the run
+                if isinstance(event.data, Run):
+                    run_state["run"] = event.data
+                if event.event == "thread.run.requires_action":
+                    tool_calls = event.data.required_action.submit_tool_outputs.tool_calls
+                    logger.debug(f"Tool calls received: {[tc.id for tc in tool_calls]}")
+                    outputs = await handle_tool_calls(tool_calls, session, emit=emit)
+                    # Remembered until submitted, so a fallback to polling does not run the tools twice
+                    run_state["pending_outputs"] = outputs
+                elif event.event == "thread.message.created" and emit:
+                    await emit("message_start", None)
+                elif event.event == "thread.message.delta" and emit:
+                    for part in event.data.delta.content or []:
+                        if part.type == "text" and part.text and part.text.value:
+                            await emit("text_delta", part.text.value)
+                elif event.event == "error":
+                    raise RuntimeError(f"Run stream error: {event.data}")
+        finally:
+            await stream.close()
+
+        run = run_state.get("run")
+        if outputs is None or run is None:
+            return run
+        stream = await client.beta.threads.runs.submit_tool_outputs(
+            thread_id=thread_id,
+            run_id=run.id,
+            tool_outputs=outputs,
+            stream=True
+        )
+        run_state.pop("pending_outputs", None)
+
+async def poll_run(thread_id: str, run_id: str, session, deadline: float, emit=None):
+    """Poll a run with adaptive backoff: quick checks first, slower ones while it keeps running."""
+    delay = settings.RUN_POLL_MIN_SECONDS
+    loop = asyncio.get_running_loop()
+    while loop.time() < deadline:
+        run_status = await client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+        logger.debug(f"***** Run status: {run_status.status}")
+        if run_status.status in RUN_TERMINAL_STATUSES:
+            return run_status
+        if run_status.status == "requires_action":
+            tool_calls = run_status.required_action.submit_tool_outputs.tool_calls
+            logger.debug(f"Tool calls received: {[tc.id for tc in tool_calls]}")
+            outputs = await handle_tool_calls(tool_calls, session, emit=emit)
 
-    return [user_threads[user_id]["threads"], user_threads[user_id]["threads"]["object"]]
+            await client.beta.threads.runs.submit_tool_outputs(
+                thread_id=thread_id,
+                run_id=run_id,
+                tool_outputs=outputs
+            )
+            delay = settings.RUN_POLL_MIN_SECONDS
+            continue
+
+        await asyncio.sleep(delay)
+        delay = min(delay * 1.5, settings.RUN_POLL_MAX_SECONDS)
+    return None
 
+async def cancel_run(thread_id: str, run):
+    """Stop a run we gave up on, so it does not keep working (and calling tools) on OpenAI's side."""
+    if run is None or run.status in RUN_TERMINAL_STATUSES:
+        return
+    try:
+        await client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run.id)
+    except Exception as e:
+        logger.warning(f"Could not cancel run {run.id}: {str(e)}")
+
+async def execute_run(thread_id: str, assistant_id: str, session, emit=None, **run_kwargs):
+    """Run an assistant on a thread until it stops, handling tool calls along the way.
+
+    Uses streaming run events when enabled, falling back to backoff polling if the
+    stream cannot be opened or breaks; ``emit`` then gets a "stream_reset" event,
+    as text streamed so far may be incomplete. Returns the final run, or None on
+    timeout (the run is cancelled).
+    """
+    deadline = asyncio.get_running_loop().time() + settings.RUN_TIMEOUT_SECONDS
+    run_state = {}
+    if settings.RUN_STREAMING:
+        try:
+            return await stream_run(thread_id, assistant_id, session, run_state, deadline, emit=emit, **run_kwargs)
+        except RunTimeout:
+            logger.error("Timeout while streaming run events.")
+            await cancel_run(thread_id, run_state.get("run"))
+            return None
+        except Exception as e:
+            logger.debug(f"Run streaming unavailable, falling back to polling: {str(e)}")
+            if emit:
+                await emit("stream_reset", None)
+
+    run = run_state.get("run")
+    if run is None:
+        run = await client.beta.threads.runs.create(
+            thread_id=thread_id,
+            assistant_id=assistant_id,
+            **run_kwargs
+        )
+    elif run.status in RUN_TERMINAL_STATUSES:
+        return run
+    elif "pending_outputs" in run_state:
+        await client.beta.threads.runs.submit_tool_outputs(
+            thread_id=thread_id,
+            run_id=run.id,
+            tool_outputs=run_state["pending_outputs"]
+        )
+    run_status = await poll_run(thread_id, run.id, session, deadline, emit=emit)
+    if run_status is None:
+        await cancel_run(thread_id, run)
+    return run_status
+
+class ReplyStream:
+    """Collects the assistant reply of a run and forwards it to an optional ``emit``.
+
+    Text deltas are forwarded as "delta" events as they arrive, with image
+    placeholders resolved inline into "image" events. ``result()`` returns the
+    text of the last message and the first image URL, like
+    ``process_text_return_image_url`` does for a complete reply. If the stream
+    breaks, what was streamed is discarded (a "reset" event tells the client) and
+    ``result()`` reads the finished message from the thread instead.
+    """
+
+    def __init__(self, emit=None, image_dir=IMAGE_DIR):
+        self.emit = emit
+        self.image_dir = image_dir
+        self.images = ImageDirectory(image_dir)
+        self.uploaded_urls = {}
+        self.filter = None
+        self.text = None  # processed text of the current message
+        self.image_url = None
+
+    async def on_event(self, name, data):
+        if name == "stream_reset":
+            if self.text is not None and self.emit:
+                await self.emit("reset", None)
+            self.filter = None
+            self.text = None
+            self.image_url = None
+        elif name == "message_start":
+            await self._flush()
+            self.filter = PlaceholderStreamFilter()
+            self.text = ""
+        elif name == "text_delta":
+            if self.filter is None:
+                await self.on_event("message_start", None)
+            await self._handle(self.filter.feed(data))
+        elif self.emit:
+            await self.emit(name, data)
+
+    async def on_tool_event(self, name, data):
+        """Forward only tool progress (used for runs whose text is not shown)."""
+        if name == "tool" and self.emit:
+            await self.emit(name, data)
+
+    async def _handle(self, segments):
+        for kind, value in segments:
+            if kind == "placeholder":
+                value, url = await asyncio.to_thread(
+                    resolve_image_placeholder, value, self.images, self.uploaded_urls
+                )
+                if url and self.image_url is None:
+                    self.image_url = url
+                    if self.emit:
+                        await self.emit("image", {"url": url})
+            if value:
+                self.text += value
+                if self.emit:
+                    await self.emit("delta", {"text": value})
+
+    async def _flush(self):
+        if self.filter is not None:
+            await self._handle(self.filter.flush())
+
+    async def result(self, thread_id):
+        await self._flush()
+        if self.text is not None:
+            return self.text, self.image_url
+
+        # Nothing was streamed (polling fallback): read the reply from the thread
+        messages = await client.beta.threads.messages.list(thread_id=thread_id)
+        response = messages.data[0].content[0].text.value
+        response, image_url = await asyncio.to_thread(process_text_return_image_url, response, image_dir=self.image_dir)
+        if self.emit:
+            if image_url:
+                await self.emit("image", {"url": image_url})
+            await self.emit("delta", {"text": response})
+        return response, image_url
+
+async def get_or_create_thread(session: dict, reset: bool) -> str:
+    """OpenAI thread id of a session, creating the thread on first use or reset."""
+    if reset or not session.get("thread_id"):
+        thread = await client.beta.threads.create()
+        session["phase"] = "info"
+        session["thread_id"] = thread.id
+        session["basic_info"] = False
+
+    return session["thread_id"]
+
+
+async def chat_with_assistant(user_id: str, message: str, reset: bool = False, file_url: str = None, emit=None):
+    # One turn at a time per user, across every worker sharing the session store
+    async with session_store.lock(user_id):
+        session = await session_store.get(user_id)
+        if reset or session is None:
+            session = new_session(user_id)
+        try:
+            return await chat_turn(session, message, reset=reset, file_url=file_url, emit=emit)
+        finally:
+            # Saved even if the turn fails, so tickets/machines created by its tools are not forgotten
+            await session_store.save(session)
 
-def chat_with_assistant(user_id: str, message: str, reset: bool = False, file_url: str = None):
-    if reset or user_id not in user_threads:
-        tickets_info[user_id] = {}
-        custom_thread_id[user_id] = str(uuid.uuid4())
-        user_threads[user_id] = {"phase": "info", "threads": {}}
-        user_info[user_id] = {"model_name": None, "serial_number": None, "machine_name": None}
 
-    current_phase = user_threads[user_id]["phase"]
+async def chat_turn(session: dict, message: str, reset: bool = False, file_url: str = None, emit=None):
+    user_info = session["user_info"]
+    tickets_info = session["tickets_info"]
+    current_phase = session["phase"]
     image_url = None
 
     if current_phase not in assistants:
         print(f"Warning: phase '{current_phase}' not found. Falling back to 'info'.")
         current_phase = "info"
-        user_threads[user_id]["phase"] = "info"
+        session["phase"] = "info"
 
-    assistant = assistants[current_phase]
-    thread_vector, thread = get_or_create_thread(user_id, reset)
+    assistant_id = assistants.id(current_phase)
+    thread_id = await get_or_create_thread(session, reset)
 
     if reset:
-        client.beta.threads.messages.create(
-            thread_id=thread.id,
+        await client.beta.threads.messages.create(
+            thread_id=thread_id,
             role="user",
             content="Forget previous conversations. Start fresh."
         )
@@ -239,21 +564,21 @@ def chat_with_assistant(user_id: str, message: str, reset: bool = False, file_ur
             # *** Save user message to your DB with custom thread_id and ticket_id ***
     try:
         db_message = ConversationMessage(
-            thread_id=custom_thread_id[user_id],
-            ticket_id=tickets_info[user_id].get("ticket_id") if user_id in tickets_info else None,
+            thread_id=session["conversation_id"],
+            ticket_id=tickets_info.get("ticket_id"),
             sender="user",
             message=message,
             media_url=file_url,
             timestamp=datetime.now(timezone.utc)  # Provide timestamp here
 
         )
-        add_conversation(db_message)
+        conversation_writer.enqueue(db_message)
     except Exception as e:
         logger.debug(f"Error saving user message: {str(e)}")
     
     if file_url:
         try:
-            result = detect_yolo(file_url)  # result is a dict
+            result = await detect_yolo_async(file_url)  # result is a dict
             detections = result["detections"]
             print(detections)
 
@@ -274,108 +599,98 @@ def chat_with_assistant(user_id: str, message: str, reset: bool = False, file_ur
         except Exception as e:
             message += f"System analysis of image \n\n❌ Error processing image: {e}"
 
-    client.beta.threads.messages.create(
-        thread_id=thread.id,
+    await client.beta.threads.messages.create(
+        thread_id=thread_id,
         role="user",
         content=message
     )
 
-    run = client.beta.threads.runs.create(
-        thread_id=thread.id,
-        assistant_id=assistant.id
-    )
-
-    retries = 0
-    MAX_RETRIES = 30
-
-    while True:
-        run_status = client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
-        logger.debug(f"***** Run status: {run_status.status}")
-        if retries >= MAX_RETRIES:
-            logger.error("Timeout or max retries exceeded. Exiting.")
-            break
-        retries += 1
-        if run_status.status == "incomplete":
-            logger.debug(f"***** {run_status.incomplete_details}")
-            break
-        elif run_status.status == "failed":
-            logger.debug(f"***** {run_status.last_error}")
-            break
-        elif run_status.status == "requires_action":
-            tool_calls = run_status.required_action.submit_tool_outputs.tool_calls
-            logger.debug(f"Tool calls received: {[tc.id for tc in tool_calls]}")
-            outputs = handle_tool_calls(tool_calls, user_id)
-
-            client.beta.threads.runs.submit_tool_outputs(
-                thread_id=thread.id,
-                run_id=run.id,
-                tool_outputs=outputs
-            )
-        elif run_status.status == "completed":
-            break
+    reply = ReplyStream(emit)
+    run_status = await execute_run(thread_id, assistant_id, session, emit=reply.on_event)
+    if run_status is None:
+        logger.error("Run did not finish before the timeout.")
+    elif run_status.status == "incomplete":
+        logger.debug(f"***** {run_status.incomplete_details}")
+    elif run_status.status == "failed":
+        logger.debug(f"***** {run_status.last_error}")
 
-        time.sleep(1)
+    if image_url:
+        # The annotated image uploaded while the assistant ran; make sure its URL works before replying
+        await annotation_uploads.wait(image_url, timeout=settings.IMAGE_UPLOAD_WAIT_SECONDS)
 
-    messages = client.beta.threads.messages.list(thread_id=thread.id)
-    response = messages.data[0].content[0].text.value
-    response, image_url = process_text_return_image_url(response, image_dir="data/static/images")
+    response, image_url = await reply.result(thread_id)
 
-    print("DEBUG: model_name =", user_info[user_id]["model_name"])
-    print("DEBUG: serial_number =", user_info[user_id]["serial_number"])
+    print("DEBUG: model_name =", user_info["model_name"])
+    print("DEBUG: serial_number =", user_info["serial_number"])
 
     # Transition to troubleshoot phase if info is complete
-    if current_phase == "info" and user_info[user_id]["model_name"] and user_info[user_id]["serial_number"]:
+    if current_phase == "info" and user_info["model_name"] and user_info["serial_number"]:
         
-        if not thread_vector["basic_info"]:
+        if not session["basic_info"]:
             print("TURNING IT INTO TRUE")
-            thread_vector["basic_info"] = True
+            session["basic_info"] = True
             return response, None
         
         print("✅ All information collected. Moving to troubleshooting...")
 
-        model_name = user_info[user_id]["model_name"]
-        serial_number = user_info[user_id]["serial_number"]
+        model_name = user_info["model_name"]
+        serial_number = user_info["serial_number"]
         print(f"MOVING TO TROUBLESHOOT for model {model_name} and serial number {serial_number}")
 
-        user_threads[user_id]["phase"] = "troubleshoot"
-        assistant = assistants["troubleshoot"]
+        session["phase"] = "troubleshoot"
+        assistant_id = assistants.id("troubleshoot")
 
-        run = client.beta.threads.runs.create(
-            thread_id=thread.id,
-            assistant_id=assistant.id,
+        # Run again for troubleshoot phase
+        await execute_run(
+            thread_id,
+            assistant_id,
+            session,
+            emit=reply.on_tool_event,
             additional_instructions=f"The user's machine model is {model_name} and serial number is {serial_number}"
         )
 
-        # Poll again for troubleshoot phase
-        while True:
-            run_status = client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
-
-            if run_status.status == "requires_action":
-                tool_calls = run_status.required_action.submit_tool_outputs.tool_calls
-                outputs = handle_tool_calls(tool_calls, user_id)
-
-                client.beta.threads.runs.submit_tool_outputs(
-                    thread_id=thread.id,
-                    run_id=run.id,
-                    tool_outputs=outputs
-                )
-            elif run_status.status == "completed":
-                break
-
-            time.sleep(1)
-
     try:
         db_message = ConversationMessage(
-            thread_id=custom_thread_id[user_id],
-            ticket_id=tickets_info[user_id].get("ticket_id") if user_id in tickets_info else None,
+            thread_id=session["conversation_id"],
+            ticket_id=tickets_info.get("ticket_id"),
             sender="assistant",
             message=response,
             media_url=image_url,
             timestamp=datetime.now(timezone.utc)  # Provide timestamp here
         )
-        add_conversation(db_message)
+        conversation_writer.enqueue(db_message)
     except Exception as e:
         logger.debug(f"Error saving assistant message: {str(e)}")
 
     # FOR NOW: NONE
-    return response, image_url
\ No newline at end of file
+    return response, image_url
+
+async def chat_events(user_id: str, message: str, reset: bool = False, file_url: str = None):
+    """Run a chat turn, yielding {"event", "data"} dicts as the reply is produced.
+
+    Events: "delta" (text), "tool" (progress), "image" (url), then "done" with the
+    full response, or "error".
+    """
+    queue = asyncio.Queue()
+
+    async def emit(event, data):
+        await queue.put({"event": event, "data": data})
+
+    async def run_turn():
+        try:
+            response, image_url = await chat_with_assistant(user_id, message, reset=reset, file_url=file_url, emit=emit)
+            await emit("done", {"response": response, "image_url": image_url})
+        except Exception as e:
+            logger.debug(f"Error in streamed chat turn: {str(e)}")
+            await emit("error", {"detail": str(e)})
+        finally:
+            await queue.put(None)
+
+    # The turn keeps running if the client disconnects, so state and history stay consistent
+    task = asyncio.create_task(run_turn())
+    while True:
+        event = await queue.get()
+        if event is None:
+            break
+        yield event
+    await task
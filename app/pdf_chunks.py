@@ -0,0 +1,67 @@
+import bisect
+from typing import Iterator, NamedTuple
+
+import fitz  # PyMuPDF
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+SEPARATORS = ["\n\n", "\n", ".", " ", ""]
+WINDOW_CHUNKS = 8  # chunks of text buffered before the splitter runs
+
+
+class PdfChunk(NamedTuple):
+    text: str
+    first_page: int  # 1-based
+    last_page: int
+
+
+def iter_pages(pdf_path: str) -> Iterator[tuple]:
+    """``(page number, text)`` of each page, one page in memory at a time."""
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            yield page.number + 1, page.get_text("text")
+
+
+def iter_pdf_chunks(pdf_path: str, chunk_size: int, chunk_overlap: int) -> Iterator[PdfChunk]:
+    """Split a PDF into overlapping chunks, page by page.
+
+    Text is buffered only until a few chunks' worth is available; every chunk but
+    the last is then emitted and the buffer restarts at the last one, so chunks
+    still span page boundaries while memory stays bounded by the window size.
+    """
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=SEPARATORS,
+        add_start_index=True,
+    )
+    buffer = ""
+    page_starts, page_numbers = [], []  # buffer offset where each buffered page begins
+
+    def split(final):
+        nonlocal buffer, page_starts, page_numbers
+        docs = splitter.create_documents([buffer])
+        emit = docs if final else docs[:-1]
+        for doc in emit:
+            start = doc.metadata["start_index"]
+            end = start + len(doc.page_content)
+            first = page_numbers[max(bisect.bisect_right(page_starts, start) - 1, 0)]
+            last = page_numbers[max(bisect.bisect_left(page_starts, end) - 1, 0)]
+            yield PdfChunk(doc.page_content, first, last)
+        if not final and emit:
+            # Keep the unfinished tail, starting at the last (possibly incomplete) chunk
+            cut = docs[-1].metadata["start_index"]
+            keep = max(bisect.bisect_right(page_starts, cut) - 1, 0)
+            page_starts = [max(offset - cut, 0) for offset in page_starts[keep:]]
+            page_numbers = page_numbers[keep:]
+            buffer = buffer[cut:]
+
+    for page_number, text in iter_pages(pdf_path):
+        if not text.strip():
+            continue
+        page_starts.append(len(buffer))
+        page_numbers.append(page_number)
+        buffer += text + "\n"
+        if len(buffer) >= chunk_size * WINDOW_CHUNKS:
+            yield from split(final=False)
+    if buffer.strip():
+        yield from split(final=True)
@@ -1,16 +1,18 @@
 import os
 import faiss
-import pickle
 import numpy as np
 import openai
+from app.chunk_store import load_texts, texts_path
 from app.config import settings
+from app.embedding_cache import embedding_cache
 
 openai.api_key = settings.API_KEY
 
 # === Load FAISS and text map for a machine ===
 def load_machine_index(machine_name):
-    index_path = os.path.join(settings.FAISS_INDEX_ROOT, machine_name, "index.faiss")
-    text_map_path = os.path.join(settings.FAISS_INDEX_ROOT, machine_name, "index.pkl")
+    machine_dir = os.path.join(settings.FAISS_INDEX_ROOT, machine_name)
+    index_path = os.path.join(machine_dir, "index.faiss")
+    text_map_path = texts_path(machine_dir)
 
     if not os.path.exists(index_path):
         raise FileNotFoundError(f"FAISS index not found for machine {machine_name} at {index_path}")
@@ -18,18 +20,20 @@ def load_machine_index(machine_name):
         raise FileNotFoundError(f"Text mapping not found for machine {machine_name} at {text_map_path}")
 
     index = faiss.read_index(index_path)
-    with open(text_map_path, "rb") as f:
-        id_to_text = pickle.load(f)
+    id_to_text = load_texts(machine_dir)
 
     return index, id_to_text
 
 # === Get OpenAI embedding ===
 def get_embedding(text: str, model: str = "text-embedding-ada-002") -> list:
-    response = openai.Embedding.create(
-        input=[text],
-        model=model
-    )
-    return response["data"][0]["embedding"]
+    def compute(text):
+        response = openai.Embedding.create(
+            input=[text],
+            model=model
+        )
+        return response["data"][0]["embedding"]
+
+    return embedding_cache.get_or_compute(model, text, compute)
 
 # === Retrieve context from a machine ===
 def retrieve_context(query, machine_name, k=5):
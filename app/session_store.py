@@ -0,0 +1,351 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from .config import settings
+from .logger import logger
+
+LOCK_POLL_SECONDS = 0.05
+
+
+def new_session(user_id: str) -> dict:
+    """Fresh conversation state of a user (also what a reset starts from)."""
+    return {
+        "user_id": user_id,
+        "phase": "info",
+        "thread_id": None,  # OpenAI thread, created lazily
+        "basic_info": False,
+        "conversation_id": str(uuid.uuid4()),  # thread_id of the rows in the conversations table
+        "user_info": {"model_name": None, "serial_number": None, "machine_name": None},
+        "tickets_info": {},
+    }
+
+
+class SessionStore(ABC):
+    """Per-user conversation state shared by every worker that uses the same backend.
+
+    Sessions are plain JSON-serializable dicts (see ``new_session``), dropped once
+    idle for ``ttl_seconds``. Callers hold ``lock(user_id)`` for a whole turn, so
+    two requests of one user never interleave their reads, phase transitions and
+    writes.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._local_locks = {}  # user_id → [asyncio.Lock, holders + waiters]
+
+    @abstractmethod
+    async def get(self, user_id: str):
+        """The user's session, or None if there is none (or it expired)."""
+
+    @abstractmethod
+    async def save(self, session: dict):
+        """Store a session under its ``user_id``."""
+
+    @abstractmethod
+    async def delete(self, user_id: str):
+        """Forget a user's session."""
+
+    async def close(self):
+        pass
+
+    async def stats(self) -> dict:
+        return {"backend": self.backend, "locked_users": len(self._local_locks)}
+
+    @asynccontextmanager
+    async def lock(self, user_id: str):
+        """Exclusive access to one user's session for the duration of the block."""
+        async with self._local_lock(user_id):
+            token = await self._acquire_shared(user_id)
+            try:
+                yield
+            finally:
+                await self._release_shared(user_id, token)
+
+    @asynccontextmanager
+    async def _local_lock(self, user_id: str):
+        # Serializes the coroutines of this process; dropped once nobody uses it
+        entry = self._local_locks.setdefault(user_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._local_locks.pop(user_id, None)
+
+    async def _acquire_shared(self, user_id: str):
+        """Cross-process part of ``lock``; nothing to do for a single-process backend."""
+        return None
+
+    async def _release_shared(self, user_id: str, token):
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """Sessions in this process only.
+
+    A session is evicted once idle for ``ttl_seconds``, and the least recently
+    active ones are evicted early whenever the sessions together exceed
+    ``max_bytes`` (measured as their JSON size).
+    """
+
+    backend = "memory"
+
+    def __init__(self, ttl_seconds: float, max_bytes: int):
+        super().__init__(ttl_seconds)
+        self.max_bytes = max_bytes
+        self._sessions = OrderedDict()  # user_id → [last_active, nbytes, session], least recently active first
+        self._total_bytes = 0
+        self.idle_evictions = 0
+        self.budget_evictions = 0
+
+    def _drop(self, user_id: str):
+        entry = self._sessions.pop(user_id)
+        self._total_bytes -= entry[1]
+
+    def _evict(self, now: float):
+        while self._sessions:
+            user_id, (last_active, _, _) = next(iter(self._sessions.items()))
+            if last_active + self.ttl_seconds > now:
+                break
+            self._drop(user_id)
+            self.idle_evictions += 1
+        # Always keep the most recent session, even if it alone exceeds the budget
+        while self._total_bytes > self.max_bytes and len(self._sessions) > 1:
+            user_id = next(iter(self._sessions))
+            self._drop(user_id)
+            self.budget_evictions += 1
+            logger.debug(f"Evicted session of {user_id} to stay within the memory budget")
+
+    async def get(self, user_id: str):
+        now = time.time()
+        self._evict(now)
+        entry = self._sessions.get(user_id)
+        if entry is None:
+            return None
+        entry[0] = now
+        self._sessions.move_to_end(user_id)
+        return entry[2]
+
+    async def save(self, session: dict):
+        user_id = session["user_id"]
+        nbytes = len(json.dumps(session, ensure_ascii=False).encode("utf-8"))
+        if user_id in self._sessions:
+            self._drop(user_id)
+        now = time.time()
+        self._sessions[user_id] = [now, nbytes, session]
+        self._total_bytes += nbytes
+        self._evict(now)
+
+    async def delete(self, user_id: str):
+        if user_id in self._sessions:
+            self._drop(user_id)
+
+    async def stats(self) -> dict:
+        self._evict(time.time())
+        return {
+            **await super().stats(),
+            "sessions": len(self._sessions),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "idle_evictions": self.idle_evictions,
+            "budget_evictions": self.budget_evictions,
+        }
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions in a SQLite file, shared by the workers of one host and kept across restarts.
+
+    The cross-process lock is a lease row in ``session_locks``; a lease left by a
+    crashed worker expires after ``lock_timeout`` seconds. Sessions idle for
+    ``ttl_seconds`` are deleted on the next save.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path: str, ttl_seconds: float, lock_timeout: float):
+        super().__init__(ttl_seconds)
+        self.path = path
+        self.lock_timeout = lock_timeout
+        self._db = None
+        self._db_lock = threading.Lock()
+
+    def _connect(self):
+        if self._db is not None:
+            return self._db
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        db = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                user_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        db.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS session_locks (
+                user_id TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        db.commit()
+        self._db = db
+        logger.info(f"Session store opened at {self.path}")
+        return db
+
+    def _execute(self, query, params=()):
+        with self._db_lock:
+            db = self._connect()
+            cursor = db.execute(query, params)
+            rows = cursor.fetchall()
+            db.commit()
+            return rows, cursor.rowcount
+
+    async def get(self, user_id: str):
+        rows, _ = await asyncio.to_thread(
+            self._execute,
+            "SELECT data FROM sessions WHERE user_id = ? AND expires_at > ?",
+            (user_id, time.time()),
+        )
+        return json.loads(rows[0][0]) if rows else None
+
+    def _save(self, session: dict):
+        now = time.time()
+        with self._db_lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO sessions (user_id, data, expires_at) VALUES (?, ?, ?)",
+                (session["user_id"], json.dumps(session, ensure_ascii=False), now + self.ttl_seconds),
+            )
+            db.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+            db.commit()
+
+    async def save(self, session: dict):
+        await asyncio.to_thread(self._save, session)
+
+    async def delete(self, user_id: str):
+        await asyncio.to_thread(self._execute, "DELETE FROM sessions WHERE user_id = ?", (user_id,))
+
+    def _try_lease(self, user_id: str, owner: str) -> bool:
+        now = time.time()
+        with self._db_lock:
+            db = self._connect()
+            db.execute("DELETE FROM session_locks WHERE user_id = ? AND expires_at <= ?", (user_id, now))
+            cursor = db.execute(
+                "INSERT OR IGNORE INTO session_locks (user_id, owner, expires_at) VALUES (?, ?, ?)",
+                (user_id, owner, now + self.lock_timeout),
+            )
+            db.commit()
+            return cursor.rowcount == 1
+
+    async def _acquire_shared(self, user_id: str):
+        owner = uuid.uuid4().hex
+        while not await asyncio.to_thread(self._try_lease, user_id, owner):
+            await asyncio.sleep(LOCK_POLL_SECONDS)
+        return owner
+
+    async def _release_shared(self, user_id: str, token):
+        await asyncio.to_thread(
+            self._execute, "DELETE FROM session_locks WHERE user_id = ? AND owner = ?", (user_id, token)
+        )
+
+    async def stats(self) -> dict:
+        rows, _ = await asyncio.to_thread(
+            self._execute,
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(CAST(data AS BLOB))), 0) FROM sessions WHERE expires_at > ?",
+            (time.time(),),
+        )
+        return {**await super().stats(), "sessions": rows[0][0], "bytes": rows[0][1]}
+
+    async def close(self):
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class RedisSessionStore(SessionStore):
+    """Sessions in Redis, shared by every worker and host pointing at the same server.
+
+    Idle sessions expire through the Redis TTL, renewed on every save.
+    """
+
+    backend = "redis"
+
+    def __init__(self, client, ttl_seconds: float, lock_timeout: float, prefix: str = "session:"):
+        super().__init__(ttl_seconds)
+        self.redis = client
+        self.lock_timeout = lock_timeout
+        self.prefix = prefix
+
+    async def get(self, user_id: str):
+        data = await self.redis.get(f"{self.prefix}{user_id}")
+        return json.loads(data) if data is not None else None
+
+    async def save(self, session: dict):
+        await self.redis.set(
+            f"{self.prefix}{session['user_id']}",
+            json.dumps(session, ensure_ascii=False),
+            ex=int(self.ttl_seconds),
+        )
+
+    async def delete(self, user_id: str):
+        await self.redis.delete(f"{self.prefix}{user_id}")
+
+    async def _acquire_shared(self, user_id: str):
+        lock = self.redis.lock(f"{self.prefix}lock:{user_id}", timeout=self.lock_timeout)
+        await lock.acquire()
+        return lock
+
+    async def _release_shared(self, user_id: str, token):
+        try:
+            await token.release()
+        except Exception as e:  # lease already expired
+            logger.warning(f"Session lock of {user_id} was lost before release: {str(e)}")
+
+    async def stats(self) -> dict:
+        sessions = 0
+        async for key in self.redis.scan_iter(match=self.prefix + "*", count=1000):
+            if not key.startswith((self.prefix + "lock:").encode()):
+                sessions += 1
+        return {**await super().stats(), "sessions": sessions}
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+def create_session_store(backend: str = None) -> SessionStore:
+    """The session store configured by SESSION_BACKEND (memory, sqlite or redis)."""
+    backend = (backend or settings.SESSION_BACKEND).lower()
+    ttl = settings.SESSION_TTL_SECONDS
+    lock_timeout = settings.SESSION_LOCK_TIMEOUT_SECONDS
+
+    if backend == "redis":
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            logger.warning("SESSION_BACKEND=redis but the redis package is not installed; using SQLite instead.")
+            backend = "sqlite"
+        else:
+            return RedisSessionStore(redis.from_url(settings.SESSION_REDIS_URL), ttl, lock_timeout)
+
+    if backend == "sqlite":
+        return SQLiteSessionStore(settings.SESSION_DB_PATH, ttl, lock_timeout)
+    if backend == "memory":
+        return MemorySessionStore(ttl, settings.SESSION_MEMORY_MAX_BYTES)
+    raise ValueError(f"Unknown SESSION_BACKEND {backend!r}, expected memory, sqlite or redis")
+
+
+session_store = create_session_store()
@@ -1,7 +1,8 @@
+import asyncio
 import traceback
 from uuid import uuid4
 from datetime import datetime, timezone
-from routes import add_conversation, ConversationMessage  # adjust import
+from app.routes import add_conversation, ConversationMessage  # run with: python -m app.test
 
 def test_call_add_conversation():
     test_msg = ConversationMessage(
@@ -14,7 +15,7 @@ def test_call_add_conversation():
     )
 
     try:
-        result = add_conversation(test_msg)
+        result = asyncio.run(add_conversation(test_msg))
         print("Function output:", result)
     except Exception as e:
         print("Error:", e)
@@ -1,11 +1,14 @@
 # app/tools/info_tool.py
 
-import requests
+import httpx
+
+from app.http_client import backend
 
 API_BASE_URL = "http://localhost:5000/api/machines"  
 
-def search_machine(user_id: int, serial_number: str):
-    response = requests.post(f"{API_BASE_URL}/find", json={
+async def search_machine(user_id: int, serial_number: str):
+    # Lookups are read-only, so they are safe to retry
+    response = await backend.post(f"{API_BASE_URL}/find", "machines.find", idempotent=True, json={
         "user_id": user_id,
         "search_string": serial_number
     })
@@ -14,9 +17,9 @@ def search_machine(user_id: int, serial_number: str):
     else:
         return {"found": False}
 
-def search_machines_by_model(user_id: int, model_name: str):
+async def search_machines_by_model(user_id: int, model_name: str):
     print(user_id)
-    response = requests.post(f"{API_BASE_URL}/find_by_model", json={
+    response = await backend.post(f"{API_BASE_URL}/find_by_model", "machines.find_by_model", idempotent=True, json={
         "user_id": user_id,
         "model": model_name
     })
@@ -25,12 +28,20 @@ def search_machines_by_model(user_id: int, model_name: str):
     else:
         return {"found": False}
 
-def create_machine(user_id: int, model: str, serial_number: str):
-    response = requests.post(f"{API_BASE_URL}/", json={
-        "user_id": user_id,
-        "model": model,
-        "serial_number": serial_number
-    })
+async def create_machine(user_id: int, model: str, serial_number: str):
+    try:
+        response = await backend.post(f"{API_BASE_URL}/", "machines.create", json={
+            "user_id": user_id,
+            "model": model,
+            "serial_number": serial_number
+        })
+    except httpx.TimeoutException as e:
+        # The backend may still have created it; retrying blindly could duplicate the machine
+        return {
+            "created": False,
+            "outcome": "unknown",
+            "error": f"Timed out waiting for the backend; the machine may have been created: {e}"
+        }
     data = response.json()  # Always get the full response JSON
 
     if response.status_code == 201:
@@ -39,12 +50,12 @@ def create_machine(user_id: int, model: str, serial_number: str):
         return {"created": False, "error": data, "status_code": response.status_code}
 
 
-def match_model(model_name: str, user_id: int):
+async def match_model(model_name: str, user_id: int):
     # Validate against known models
     valid_models = ["EC220D", "WLOL60H", "WLO70H"]
     valid = model_name.upper() in valid_models
     if valid:
-        machines_result = search_machines_by_model(user_id, model_name)
+        machines_result = await search_machines_by_model(user_id, model_name)
         if machines_result["found"]:
             serials = [m["serial_number"] for m in machines_result["data"]["machines"]]
             return {
@@ -61,10 +72,10 @@ def match_model(model_name: str, user_id: int):
     else:
         return {"model_name": None, "related_serial_numbers": []}
 
-def match_serial_number(serial_number: str, user_id: int):
+async def match_serial_number(serial_number: str, user_id: int):
     try:
         print("Trying to get machine")
-        data = search_machine(user_id, serial_number)
+        data = await search_machine(user_id, serial_number)
     except Exception as e:
         print(e)
         return {"serial_number": None}
@@ -1,4 +1,6 @@
-import requests
+import httpx
+
+from app.http_client import backend
 
 API_BASE_URL = "http://localhost:5000/api/tickets"  
 
@@ -76,7 +78,7 @@ edit_ticket_tool = {
 
 # === TICKET FUNCTIONS ===
 
-def create_ticket(machine_id: int, title: str, description: str):
+async def create_ticket(machine_id: int, title: str, description: str):
     url = f"{API_BASE_URL}/add"
     payload = {
         "machine_id": machine_id,
@@ -85,7 +87,7 @@ def create_ticket(machine_id: int, title: str, description: str):
     }
 
     try:
-        response = requests.post(url, json=payload)
+        response = await backend.post(url, "tickets.add", json=payload)
         response.raise_for_status()
         data = response.json()
         return {
@@ -93,18 +95,26 @@ def create_ticket(machine_id: int, title: str, description: str):
             "ticket": data.get("ticket", {})
         }
 
-    except requests.RequestException as e:
+    except httpx.TimeoutException as e:
+        # The backend may still have created it; retrying blindly could duplicate the ticket
+        print(f"Timed out creating ticket: {e}")
+        return {
+            "success": False,
+            "outcome": "unknown",
+            "error": f"Timed out waiting for the backend; the ticket may have been created: {e}"
+        }
+    except httpx.HTTPError as e:
         print(f"Failed to create ticket: {e}")
         return {
             "success": False,
             "error": str(e)
         }
 
-def solve_ticket(ticket_id: str):
+async def solve_ticket(ticket_id: str):
     url = f"{API_BASE_URL}/resolve/{ticket_id}"
 
     try:
-        response = requests.put(url)
+        response = await backend.put(url, "tickets.resolve", idempotent=True)
         response.raise_for_status()
         data = response.json()
         return {
@@ -112,14 +122,14 @@ def solve_ticket(ticket_id: str):
             "ticket": data.get("ticket", {})
         }
 
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"Failed to resolve ticket: {e}")
         return {
             "success": False,
             "error": str(e)
         }
 
-def edit_ticket(ticket_id: int, title: str, description: str):
+async def edit_ticket(ticket_id: int, title: str, description: str):
     url = f"{API_BASE_URL}/edit/{ticket_id}"
     payload = {
         "title": title,
@@ -127,7 +137,7 @@ def edit_ticket(ticket_id: int, title: str, description: str):
     }
 
     try:
-        response = requests.put(url, json=payload)
+        response = await backend.put(url, "tickets.edit", idempotent=True, json=payload)
         response.raise_for_status()
         data = response.json()
         return {
@@ -135,7 +145,7 @@ def edit_ticket(ticket_id: int, title: str, description: str):
             "ticket": data.get("ticket", {})
         }
 
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"Failed to edit ticket: {e}")
         return {
             "success": False,
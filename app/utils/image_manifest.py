@@ -0,0 +1,86 @@
+import json
+import os
+from collections import Counter
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+from app.config import settings
+from app.logger import logger
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif")
+MATCH_CUTOFF = 0.6  # same cutoff as difflib.get_close_matches
+MAX_CANDIDATES = 10
+
+
+def trigrams(name: str):
+    padded = f"  {name.lower()} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ImageManifest:
+    """Manual figures already uploaded, by filename, with a trigram index for fuzzy lookups.
+
+    Built by ``python -m scripts.sync_images``; lets replies resolve ``[name.png]``
+    placeholders without listing the image directory or uploading anything.
+    """
+
+    def __init__(self, images: dict):
+        self.images = images  # filename → {"sha256", "url", "bytes"}
+        self._postings = {}
+        for filename in images:
+            for gram in trigrams(filename):
+                self._postings.setdefault(gram, []).append(filename)
+
+    def match(self, requested: str):
+        """The filename closest to ``requested``, or None if nothing is close enough."""
+        if requested in self.images:
+            return requested
+        shared = Counter()
+        for gram in trigrams(requested):
+            shared.update(self._postings.get(gram, ()))
+
+        # Only the filenames sharing the most trigrams are scored exactly
+        best, best_ratio = None, 0.0
+        for filename, _ in shared.most_common(MAX_CANDIDATES):
+            ratio = SequenceMatcher(None, filename, requested).ratio()
+            if ratio >= MATCH_CUTOFF and ratio > best_ratio:
+                best, best_ratio = filename, ratio
+        return best
+
+    def url_for(self, requested: str):
+        """Uploaded URL of the image closest to ``requested``, or None."""
+        filename = self.match(requested)
+        return self.images[filename]["url"] if filename else None
+
+
+def read_manifest(path: str) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"images": {}}
+
+
+def write_manifest(path: str, manifest: dict):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+@lru_cache(maxsize=4)
+def _load_manifest(path: str, mtime_ns: int) -> ImageManifest:
+    manifest = ImageManifest(read_manifest(path)["images"])
+    logger.info(f"Image manifest loaded from {path} with {len(manifest.images)} images")
+    return manifest
+
+
+def get_manifest(path: str = None):
+    """The image manifest, reloaded when the file changes; None if it was never built."""
+    path = path or settings.IMAGE_MANIFEST_PATH
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    return _load_manifest(path, mtime_ns)
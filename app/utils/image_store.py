@@ -0,0 +1,152 @@
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+
+import requests
+
+from app.config import settings
+from app.logger import logger
+
+CLOUDINARY_URL = "https://api.cloudinary.com/v1_1/dn8rj0auz/image/upload"
+UPLOAD_PRESET = "sugar-2025"
+
+UPLOAD_ATTEMPTS = 3
+KNOWN_UPLOADS_MAX = 4096
+
+
+def content_key(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class CloudinaryStore:
+    """Unsigned Cloudinary uploads with the content hash as public id, so an
+    image's URL is known before (and without) uploading it."""
+
+    def __init__(self, upload_url: str = CLOUDINARY_URL, upload_preset: str = UPLOAD_PRESET):
+        self.upload_url = upload_url
+        self.upload_preset = upload_preset
+        cloud_name = upload_url.rstrip("/").split("/")[-3]
+        self.delivery_url = f"https://res.cloudinary.com/{cloud_name}/image/upload"
+
+    def url_for(self, key: str, ext: str) -> str:
+        return f"{self.delivery_url}/{key}.{ext}"
+
+    def upload(self, key: str, data: bytes, ext: str) -> str:
+        files = {"file": (f"{key}.{ext}", data)}
+        fields = {"upload_preset": self.upload_preset, "public_id": key}
+        response = requests.post(self.upload_url, files=files, data=fields, timeout=30)
+        response.raise_for_status()
+        # An upload preset with a folder or unique filenames would store the asset elsewhere
+        uploaded = response.json()
+        public_id, secure_url = uploaded.get("public_id"), uploaded.get("secure_url") or ""
+        if public_id != key or not secure_url.startswith(f"{self.delivery_url}/"):
+            raise RuntimeError(
+                f"Cloudinary stored the upload as {public_id!r} at {secure_url!r}, not at {self.url_for(key, ext)}"
+            )
+        return self.url_for(key, ext)
+
+
+class LocalStore:
+    """Files under a local directory served at ``base_url``; a stand-in for tests and offline use."""
+
+    def __init__(self, directory: str, base_url: str):
+        self.directory = directory
+        self.base_url = base_url.rstrip("/")
+
+    def url_for(self, key: str, ext: str) -> str:
+        return f"{self.base_url}/{key}.{ext}"
+
+    def upload(self, key: str, data: bytes, ext: str) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{key}.{ext}")
+        if not os.path.exists(path):
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return self.url_for(key, ext)
+
+
+def create_image_store(backend: str = None):
+    """The image store configured by IMAGE_STORE_BACKEND (cloudinary or local)."""
+    backend = (backend or settings.IMAGE_STORE_BACKEND).lower()
+    if backend == "cloudinary":
+        return CloudinaryStore()
+    if backend == "local":
+        return LocalStore(settings.IMAGE_STORE_LOCAL_DIR, settings.IMAGE_STORE_LOCAL_URL)
+    raise ValueError(f"Unknown IMAGE_STORE_BACKEND {backend!r}, expected cloudinary or local")
+
+
+class BackgroundUploader:
+    """Uploads images off the request path, at most once per content hash.
+
+    ``submit`` returns the final URL immediately; the upload runs as a background
+    task that ``wait`` can await when the URL is about to be shown to a user.
+    ``on_uploaded`` callbacks run only once the URL is live, never after a failed upload.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._uploads = {}  # url → task
+        self._done = OrderedDict()  # urls known to be uploaded, most recent last
+        self.deduplicated = 0
+        self.failed = 0
+
+    def submit(self, data: bytes, ext: str = "jpg", on_uploaded=None) -> str:
+        key = content_key(data)
+        url = self.store.url_for(key, ext)
+        if url in self._done:
+            self.deduplicated += 1
+            if on_uploaded:
+                on_uploaded(url)
+            return url
+        task = self._uploads.get(url)
+        if task is not None:
+            self.deduplicated += 1
+        else:
+            task = self._uploads[url] = asyncio.create_task(self._upload(url, key, data, ext))
+        if on_uploaded:
+            task.add_done_callback(lambda t: not t.cancelled() and t.result() and on_uploaded(url))
+        return url
+
+    async def _upload(self, url, key, data, ext) -> bool:
+        try:
+            for attempt in range(1, UPLOAD_ATTEMPTS + 1):
+                try:
+                    await asyncio.to_thread(self.store.upload, key, data, ext)
+                    self._done[url] = True
+                    while len(self._done) > KNOWN_UPLOADS_MAX:
+                        self._done.popitem(last=False)
+                    return True
+                except Exception as e:
+                    logger.warning(f"Upload of {url} failed (attempt {attempt}/{UPLOAD_ATTEMPTS}): {str(e)}")
+                    if attempt < UPLOAD_ATTEMPTS:
+                        await asyncio.sleep(0.5 * 2 ** (attempt - 1))
+            self.failed += 1
+            return False
+        finally:
+            self._uploads.pop(url, None)
+
+    async def wait(self, url: str, timeout: float = None) -> bool:
+        """Wait for a submitted upload; True once the URL is live."""
+        task = self._uploads.get(url)
+        if task is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(task), timeout)
+            except asyncio.TimeoutError:
+                return False
+        return url in self._done
+
+    async def stop(self):
+        """Let pending uploads finish (called on shutdown)."""
+        if self._uploads:
+            await asyncio.gather(*self._uploads.values(), return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._uploads),
+            "uploaded": len(self._done),
+            "deduplicated": self.deduplicated,
+            "failed": self.failed,
+        }
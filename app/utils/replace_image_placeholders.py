@@ -4,51 +4,114 @@ from io import BytesIO
 import requests
 from PIL import Image
 from difflib import get_close_matches
+from app.utils.image_manifest import get_manifest
 
 CLOUDINARY_URL = "https://api.cloudinary.com/v1_1/dn8rj0auz/image/upload"
 UPLOAD_PRESET = "sugar-2025"
 
-def process_text_return_image_url(text, image_dir="data/static/images"):
-    all_images = os.listdir(image_dir)
-    uploaded_urls = {}
+PLACEHOLDER_PATTERN = r"\[([\w\-]+\.(?:png|jpg|jpeg|gif))\]"
+# A tail that may still grow into a placeholder, e.g. "[cooling_fan_comp"
+PARTIAL_PLACEHOLDER_PATTERN = r"\[[\w\-]*(?:\.[a-z]*)?$"
+MAX_PLACEHOLDER_LENGTH = 128
+
+def upload_to_cloudinary(filepath):
+    with Image.open(filepath) as img:
+        buffer = BytesIO()
+        img.save(buffer, format=img.format)
+        buffer.seek(0)
+        files = {"file": buffer}
+        data = {"upload_preset": UPLOAD_PRESET}
+        response = requests.post(CLOUDINARY_URL, files=files, data=data)
+        if response.status_code == 200:
+            return response.json().get("secure_url")
+        else:
+            return None
+
+class ImageDirectory:
+    """A local image folder, listed at most once (and only if an image is needed from it)."""
 
-    def upload_to_cloudinary(filepath):
-        with Image.open(filepath) as img:
-            buffer = BytesIO()
-            img.save(buffer, format=img.format)
-            buffer.seek(0)
-            files = {"file": buffer}
-            data = {"upload_preset": UPLOAD_PRESET}
-            response = requests.post(CLOUDINARY_URL, files=files, data=data)
-            if response.status_code == 200:
-                return response.json().get("secure_url")
-            else:
-                return None
+    def __init__(self, path):
+        self.path = path
+        self._names = None
 
+    @property
+    def names(self):
+        if self._names is None:
+            self._names = os.listdir(self.path)
+        return self._names
+
+def resolve_image_placeholder(requested_filename, images, uploaded_urls):
+    """URL of the image closest to a placeholder name. Returns (replacement text, url or None).
+
+    Images in the manifest (see scripts/sync_images.py) are already uploaded; anything
+    else is looked up in the ``ImageDirectory`` ``images`` and uploaded.
+    """
+    manifest = get_manifest()
+    if manifest is not None:
+        url = manifest.url_for(requested_filename)
+        if url:
+            return "", url
+
+    closest = get_close_matches(requested_filename, images.names, n=1)
+    if not closest:
+        return "[Missing image]", None
+    closest_file = closest[0]
+    local_path = os.path.join(images.path, closest_file)
+    if closest_file not in uploaded_urls:
+        url = upload_to_cloudinary(local_path)
+        if not url:
+            return "[Upload failed]", None
+        uploaded_urls[closest_file] = url
+    return "", uploaded_urls[closest_file]
+
+def process_text_return_image_url(text, image_dir="data/static/images"):
+    images = ImageDirectory(image_dir)  # listed once per reply, if at all
+    uploaded_urls = {}
     image_url = None
 
     def replacer(match):
         nonlocal image_url
-        requested_filename = match.group(1)
-        closest = get_close_matches(requested_filename, all_images, n=1)
-        if not closest:
-            return "[Missing image]"
-        closest_file = closest[0]
-        local_path = os.path.join(image_dir, closest_file)
-        if closest_file not in uploaded_urls:
-            url = upload_to_cloudinary(local_path)
-            if url:
-                uploaded_urls[closest_file] = url
-                # Save only the first uploaded URL to return
-                if image_url is None:
-                    image_url = url
-            else:
-                return "[Upload failed]"
-        else:
-            if image_url is None:
-                image_url = uploaded_urls[closest_file]
-        return ""
+        replacement, url = resolve_image_placeholder(match.group(1), images, uploaded_urls)
+        # Save only the first uploaded URL to return
+        if url and image_url is None:
+            image_url = url
+        return replacement
 
-    pattern = r"\[([\w\-]+\.(?:png|jpg|jpeg|gif))\]"
-    new_text = re.sub(pattern, replacer, text)
+    new_text = re.sub(PLACEHOLDER_PATTERN, replacer, text)
     return new_text, image_url
+
+class PlaceholderStreamFilter:
+    """Splits streamed text into plain text and [image.png] placeholders.
+
+    Only a trailing fragment that could still become a placeholder is held
+    back, so text is forwarded as soon as it is known not to be one.
+    """
+
+    def __init__(self):
+        self.pending = ""
+
+    def feed(self, text):
+        """Returns a list of ("text", str) and ("placeholder", filename) segments."""
+        self.pending += text
+        segments = []
+        position = 0
+        for match in re.finditer(PLACEHOLDER_PATTERN, self.pending):
+            if match.start() > position:
+                segments.append(("text", self.pending[position:match.start()]))
+            segments.append(("placeholder", match.group(1)))
+            position = match.end()
+
+        rest = self.pending[position:]
+        partial = re.search(PARTIAL_PLACEHOLDER_PATTERN, rest)
+        if partial and len(partial.group(0)) <= MAX_PLACEHOLDER_LENGTH:
+            emit, self.pending = rest[:partial.start()], rest[partial.start():]
+        else:
+            emit, self.pending = rest, ""
+        if emit:
+            segments.append(("text", emit))
+        return segments
+
+    def flush(self):
+        """Whatever is still held back, as plain text."""
+        rest, self.pending = self.pending, ""
+        return [("text", rest)] if rest else []
@@ -1,15 +1,16 @@
-import os
-import pickle
 from pathlib import Path
 from langchain_core.documents import Document 
 import backoff
 import openai
 import numpy as np
 from langchain_openai import OpenAIEmbeddings
-import faiss
 
 from .config import settings
+from .doc_router import DocumentRouter
+from .embedding_cache import embedding_cache
+from .index_cache import IndexCache
 from .logger import logger
+from .merged_index import MERGED_DIR_NAME, read_document_map, search_merged
 
 api_key = settings.API_KEY
 if not api_key:
@@ -22,64 +23,62 @@ def compute_with_backoff(thunk):
 class Vectorstore:
     def __init__(self):
         self.embeddings_provider = OpenAIEmbeddings(api_key=api_key)
-        self.index_cache = {}  # Cache of machine_name → (index, id_to_text)
+        self.index_cache = IndexCache(settings.INDEX_CACHE_MAX_BYTES)  # index dir → (index, id_to_text)
+        # Built per machine on first use; the startup warm-up builds them all in the background
+        self.router = DocumentRouter(settings.FAISS_INDEX_ROOT, refresh_seconds=settings.ROUTER_REFRESH_SECONDS)
 
     def load_machine_index(self, machine_name):
         """Load FAISS index and text mapping for a given machine."""
-        if machine_name in self.index_cache:
-            return self.index_cache[machine_name]
-
-        # Folder structure: /FAISS_DIR/ec220d/index.faiss and index.pkl
+        # Folder structure: /FAISS_DIR/ec220d/index.faiss and index.chunks (or legacy index.pkl)
         machine_dir = Path(settings.FAISS_INDEX_ROOT) / machine_name
-        index_path = machine_dir / "index.faiss"
-        mapping_path = machine_dir / "index.pkl"
-
-        if not index_path.exists() or not mapping_path.exists():
+        try:
+            return self.index_cache.get(machine_dir)
+        except FileNotFoundError:
             raise FileNotFoundError(f"FAISS index or mapping for machine '{machine_name}' not found.")
 
-        logger.info(f"Loading FAISS index for machine {machine_name}...")
-
-        index = faiss.read_index(str(index_path))
-        with open(mapping_path, "rb") as f:
-            id_to_text = pickle.load(f)
-
-        self.index_cache[machine_name] = (index, id_to_text)
-        return index, id_to_text
+    def _search_merged(self, merged_dir, query_vector, k, documents=None):
+        """Search the merged machine index, restricted to some documents if given."""
+        index, id_to_text = self.index_cache.get(merged_dir)
+        document_map = read_document_map(merged_dir)
+        hits = search_merged(
+            index, document_map, query_vector, k, documents=documents,
+            ef_search=settings.MERGED_EF_SEARCH, nprobe=settings.MERGED_NPROBE,
+        )
+        return [
+            Document(page_content=id_to_text[i], metadata={"document": document_map.locate(i)[0]})
+            for _, i in hits if i in id_to_text
+        ]
 
     def similarity_search(self, query, machine_name, k=5):
         print(query)
-        query_words = query.upper().split()
-
         base_dir = Path(settings.FAISS_INDEX_ROOT) / machine_name
-        matched_pdf = None
+        merged_dir = base_dir / MERGED_DIR_NAME
+
+        # Documents whose folder name matches a word of the query, best match first
+        matched_dirs = self.router.route(machine_name, query)[:settings.ROUTER_MAX_DOCUMENTS]
+        if matched_dirs:
+            logger.info(f"Matched query words with folders: {[d.name for d in matched_dirs]}")
 
-        # Look for any subdirectory whose name contains any word from the query
-        if base_dir.exists():
-            for subfolder in base_dir.iterdir():
-                if subfolder.is_dir():
-                    folder_name_upper = subfolder.name.upper()
-                    if any(word in folder_name_upper for word in query_words):
-                        matched_pdf = subfolder
-                        logger.info(f"Matched query word with folder: {subfolder.name}")
-                        break
+        embedding = embedding_cache.get_or_compute(
+            self.embeddings_provider.model, query, self.embeddings_provider.embed_query
+        )
+        query_vector = np.array([embedding]).astype("float32")
 
-        # Use matched PDF index if found
-        if matched_pdf:
-            index_path = matched_pdf / "index.faiss"
-            mapping_path = matched_pdf / "index.pkl"
-        else:
+        # One search over the merged index covers every document of the machine
+        if (merged_dir / "index.faiss").exists():
+            documents = [d.name for d in matched_dirs] or None
+            return self._search_merged(merged_dir, query_vector, k, documents=documents)
+
+        if not matched_dirs:
             # Fallback to machine-level index
-            index_path = base_dir / "index.faiss"
-            mapping_path = base_dir / "index.pkl"
+            matched_dirs = [base_dir]
             logger.info(f"No folder matched. Using machine-level index for: {machine_name}")
 
-        if not index_path.exists() or not mapping_path.exists():
-            raise FileNotFoundError(f"Index or mapping not found at {index_path} or {mapping_path}")
-
-        index = faiss.read_index(str(index_path))
-        with open(mapping_path, "rb") as f:
-            id_to_text = pickle.load(f)
+        hits = []
+        for index_dir in matched_dirs:
+            index, id_to_text = self.index_cache.get(index_dir)
+            D, I = index.search(query_vector, k)
+            hits.extend((distance, index_dir.name, id_to_text[i]) for distance, i in zip(D[0], I[0]) if i in id_to_text)
 
-        embedding = self.embeddings_provider.embed_query(query)
-        D, I = index.search(np.array([embedding]).astype("float32"), k)
-        return [Document(page_content=id_to_text[i]) for i in I[0] if i in id_to_text]
+        hits.sort(key=lambda hit: hit[0])
+        return [Document(page_content=text, metadata={"document": name}) for _, name, text in hits[:k]]
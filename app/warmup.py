@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+from .logger import logger
+
+
+class Warmup:
+    """Loads slow components in the background once the server accepts connections.
+
+    Every component is loaded lazily on first use anyway; the warm-up only moves
+    that cost off the first requests. A failed step keeps retrying in the
+    background with capped exponential backoff, so a transient error at boot
+    never leaves the server unready for good. ``report()`` backs the /ready
+    endpoint; steps added with ``required=False`` are reported but do not gate it.
+    """
+
+    def __init__(self, retry_base_seconds: float = 1.0, retry_max_seconds: float = 60.0):
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self._steps = {}  # name → async loader
+        self._required = set()
+        self._status = {}  # name → {"status", "seconds", "attempts", "error"}
+        self._task = None
+
+    def add(self, name: str, load, required: bool = True):
+        """Register an async loader; blocking loaders should wrap themselves in ``asyncio.to_thread``."""
+        self._steps[name] = load
+        self._status[name] = {"status": "pending"}
+        if required:
+            self._required.add(name)
+
+    async def _run_step(self, name, load):
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                await load()
+                self._status[name] = {"status": "ready", "seconds": round(time.perf_counter() - started, 3)}
+                logger.info(f"Warm-up of {name} finished in {time.perf_counter() - started:.2f}s")
+                return
+            except Exception as e:
+                self._status[name] = {"status": "retrying", "attempts": attempt, "error": str(e)}
+                delay = min(self.retry_base_seconds * 2 ** min(attempt - 1, 16), self.retry_max_seconds)
+                logger.warning(f"Warm-up of {name} failed (attempt {attempt}), retrying in {delay:g}s: {str(e)}")
+                await asyncio.sleep(delay)
+
+    async def _run(self):
+        await asyncio.gather(*(self._run_step(name, load) for name, load in self._steps.items()))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    @property
+    def ready(self) -> bool:
+        return all(self._status[name]["status"] == "ready" for name in self._required)
+
+    def report(self) -> dict:
+        return {"ready": self.ready, "components": {name: dict(s) for name, s in self._status.items()}}
@@ -0,0 +1,67 @@
+import time
+from io import BytesIO
+
+import numpy as np
+import requests
+from PIL import Image
+
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+LETTERBOX_FILL = 114  # gray padding, as ultralytics uses
+
+
+def download_image(image_url: str, max_bytes: int, timeout: float) -> bytes:
+    """Stream an image into memory, refusing anything larger than ``max_bytes``
+    or slower than ``timeout`` seconds overall."""
+    deadline = time.monotonic() + timeout
+    with requests.get(image_url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        declared = response.headers.get("Content-Length")
+        if declared is not None and int(declared) > max_bytes:
+            raise ValueError(f"Image is {int(declared)} bytes, over the {max_bytes} byte limit")
+
+        buffer = bytearray()
+        for chunk in response.iter_content(DOWNLOAD_CHUNK_BYTES):
+            buffer += chunk
+            if len(buffer) > max_bytes:
+                raise ValueError(f"Image exceeds the {max_bytes} byte limit")
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Image download took longer than {timeout:g}s")
+    return bytes(buffer)
+
+
+def decode_image(data: bytes, max_side: int) -> Image.Image:
+    """Decode to RGB at no more than ``max_side`` pixels on the longer side.
+
+    JPEGs are decoded directly at a reduced scale (draft mode), so a 12MP phone
+    photo is never materialized at full resolution.
+    """
+    img = Image.open(BytesIO(data))
+    img.draft("RGB", (max_side, max_side))
+    img = img.convert("RGB")
+    img.thumbnail((max_side, max_side), Image.BILINEAR)
+    return img
+
+
+def letterbox(img: Image.Image, size: int):
+    """Model input for an image: a (3, size, size) float32 array in [0, 1], resized
+    with its aspect ratio kept and padded to a square.
+
+    Returns (array, ratio, (pad_x, pad_y)), the transform ``unletterbox_boxes`` undoes.
+    """
+    width, height = img.size
+    ratio = min(size / width, size / height)
+    new_width, new_height = round(width * ratio), round(height * ratio)
+    pad_x, pad_y = (size - new_width) // 2, (size - new_height) // 2
+
+    canvas = Image.new("RGB", (size, size), (LETTERBOX_FILL,) * 3)
+    canvas.paste(img.resize((new_width, new_height), Image.BILINEAR), (pad_x, pad_y))
+    array = np.asarray(canvas, dtype=np.float32).transpose(2, 0, 1) / 255.0
+    return np.ascontiguousarray(array), ratio, (pad_x, pad_y)
+
+
+def unletterbox_boxes(boxes, ratio: float, pad, width: int, height: int):
+    """Map x1, y1, x2, y2 boxes from letterboxed model input back onto the image."""
+    boxes = boxes.copy()
+    boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - pad[0]) / ratio).clip(0, width)
+    boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - pad[1]) / ratio).clip(0, height)
+    return boxes
@@ -0,0 +1,125 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.metrics import LatencyStats
+from app.logger import logger
+
+
+class BatchedModel:
+    """Queue of pending images for one model, run in micro-batches.
+
+    Requests arriving within ``max_wait`` seconds of the first one (up to
+    ``max_batch``) share a single forward pass. One batch of a model runs at a
+    time: ultralytics predictors are not safe to call concurrently.
+    """
+
+    def __init__(self, name: str, run, executor, max_batch: int, max_wait: float):
+        self.name = name
+        self.run = run  # blocking: list of images → list of results
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.latency = LatencyStats()
+        self.batches = 0
+        self.batched_images = 0
+        self._queue = None
+        self._worker = None
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._work())
+
+    async def predict(self, image):
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        started = time.perf_counter()
+        await self._queue.put((image, future))
+        try:
+            result = await future
+        except Exception:
+            self.latency.observe(time.perf_counter() - started, error=True)
+            raise
+        self.latency.observe(time.perf_counter() - started)
+        return result
+
+    async def _next_batch(self):
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _work(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            batch = [(image, future) for image, future in batch if not future.cancelled()]
+            if not batch:
+                continue
+            try:
+                results = await loop.run_in_executor(self.executor, self.run, [image for image, _ in batch])
+            except Exception as e:
+                logger.error(f"YOLO {self.name} batch of {len(batch)} failed: {str(e)}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.batched_images += len(batch)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "mean_batch_size": round(self.batched_images / self.batches, 2) if self.batches else None,
+            **self.latency.snapshot(),
+        }
+
+    async def stop(self):
+        if self._worker is not None and not self._worker.done():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+
+
+class InferenceService:
+    """Micro-batched inference for several models, each with its own worker thread."""
+
+    def __init__(self, run_model, model_names, max_batch: int = 8, max_wait: float = 0.02):
+        self._executor = ThreadPoolExecutor(max_workers=len(model_names), thread_name_prefix="yolo")
+        self.models = {
+            name: BatchedModel(
+                name, lambda images, name=name: run_model(name, images), self._executor, max_batch, max_wait
+            )
+            for name in model_names
+        }
+        self.skipped = {name: 0 for name in model_names}
+
+    async def predict(self, name: str, image):
+        return await self.models[name].predict(image)
+
+    def skip(self, name: str):
+        """Count a model run that was not needed."""
+        self.skipped[name] += 1
+
+    def stats(self) -> dict:
+        return {name: {**model.stats(), "skipped": self.skipped[name]} for name, model in self.models.items()}
+
+    async def stop(self):
+        for model in self.models.values():
+            await model.stop()
+        self._executor.shutdown(wait=False)
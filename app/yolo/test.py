@@ -1,4 +1,4 @@
-from yolo_tool import detect_yolo
+from app.yolo.yolo_tool import detect_yolo  # run with: python -m app.yolo.test
 
 result = detect_yolo("https://res.cloudinary.com/dn8rj0auz/image/upload/v1747947996/grposvf3oxpei6ybrvh9.png")
 
@@ -1,12 +1,15 @@
-import requests
-from PIL import Image
-from io import BytesIO
-from ultralytics import YOLO
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
 import cv2
 import numpy as np
 
-CLOUDINARY_URL = "https://api.cloudinary.com/v1_1/dn8rj0auz/image/upload"
-UPLOAD_PRESET = "sugar-2025"
+from app.config import settings
+from app.yolo.image_pipeline import decode_image, download_image, letterbox, unletterbox_boxes
+from app.utils.image_store import BackgroundUploader, content_key, create_image_store
+from app.yolo.inference import InferenceService
 
 LABEL_MAP = {
     "Corrosion": "Corrosion",
@@ -15,134 +18,226 @@ LABEL_MAP = {
     "Humedecimiento": "Moisture Ingress"
 }
 
-# Carrega os dois modelos
-model_best = YOLO("app/yolo/best.pt")
-model_wire = YOLO("app/yolo/wire.pt")
-
-def get_location_label(x_center, y_center, width, height):
-    if x_center < width / 3:
-        horiz = "left"
-    elif x_center < 2 * width / 3:
-        horiz = "center"
-    else:
-        horiz = "right"
-
-    if y_center < height / 3:
-        vert = "top"
-    elif y_center < 2 * height / 3:
-        vert = "middle"
-    else:
-        vert = "bottom"
-
-    return f"{vert}-{horiz}"
-
-def iou(boxA, boxB):
-    # Compute intersection-over-union for overlap filtering
-    xA = max(boxA["x1"], boxB["x1"])
-    yA = max(boxA["y1"], boxB["y1"])
-    xB = min(boxA["x2"], boxB["x2"])
-    yB = min(boxA["y2"], boxB["y2"])
-
-    interArea = max(0, xB - xA) * max(0, yB - yA)
-    if interArea == 0:
-        return 0
-
-    boxAArea = (boxA["x2"] - boxA["x1"]) * (boxA["y2"] - boxA["y1"])
-    boxBArea = (boxB["x2"] - boxB["x1"]) * (boxB["y2"] - boxB["y1"])
-
-    return interArea / float(boxAArea + boxBArea - interArea)
+MODEL_PATHS = {
+    "best": "app/yolo/best.pt",
+    "wire": "app/yolo/wire.pt",
+}
 
-def detect_yolo(image_url):
-    response = requests.get(image_url)
-    img = Image.open(BytesIO(response.content)).convert('RGB')
+CONFIDENCE_THRESHOLD = 0.25
+
+_models = {}
+_models_lock = threading.Lock()
+_run_locks = {name: threading.Lock() for name in MODEL_PATHS}
+
+def get_models():
+    """(best, wire) YOLO models, loaded on first use (ultralytics/torch included)."""
+    with _models_lock:
+        if not _models:
+            from ultralytics import YOLO
+            loaded = {name: YOLO(path) for name, path in MODEL_PATHS.items()}
+            _models.update(loaded)
+    return _models["best"], _models["wire"]
+
+def run_model(name, inputs):
+    """Run one model on a batch of letterboxed inputs (see ``prepare_image``).
+
+    Returns, per input, an (N, 6) array of [x1, y1, x2, y2, confidence, class]
+    rows in input coordinates, plus the model's class names.
+    """
+    import torch
+
+    get_models()
+    model = _models[name]
+    batch = torch.from_numpy(np.stack(inputs))  # already resized and normalized: no preprocessing in ultralytics
+    with _run_locks[name]:  # a model's predictor must not be used by two threads at once
+        results = model(batch, conf=CONFIDENCE_THRESHOLD, verbose=False)
+    return [(r.boxes.data.cpu().numpy(), model.names) for r in results]
+
+# Concurrent detections share forward passes; see app/yolo/inference.py
+inference = InferenceService(
+    run_model,
+    list(MODEL_PATHS),
+    max_batch=settings.YOLO_MAX_BATCH,
+    max_wait=settings.YOLO_MAX_WAIT_MS / 1000,
+)
+
+# Annotated images are uploaded in the background, once per distinct image
+annotation_uploads = BackgroundUploader(create_image_store())
+
+LOCATION_ROWS = np.array(["top", "middle", "bottom"])
+LOCATION_COLUMNS = np.array(["left", "center", "right"])
+NMS_IOU_THRESHOLD = 0.5
+
+@dataclass
+class Detections:
+    """Detections of one image as parallel arrays: int boxes (N, 4) as x1, y1, x2, y2, confidences (N,) and labels."""
+    boxes: np.ndarray
+    confidence: np.ndarray
+    labels: np.ndarray
+
+    def __len__(self):
+        return len(self.confidence)
+
+    def select(self, indices):
+        return Detections(self.boxes[indices], self.confidence[indices], self.labels[indices])
+
+def location_labels(boxes, width, height):
+    """3×3 grid cell ("top-left" … "bottom-right") of every box center."""
+    x_center = (boxes[:, 0] + boxes[:, 2]) // 2
+    y_center = (boxes[:, 1] + boxes[:, 3]) // 2
+    column = (x_center >= width / 3).astype(int) + (x_center >= 2 * width / 3)
+    row = (y_center >= height / 3).astype(int) + (y_center >= 2 * height / 3)
+    return np.char.add(np.char.add(LOCATION_ROWS[row], "-"), LOCATION_COLUMNS[column])
+
+def iou_matrix(boxes_a, boxes_b):
+    """Intersection-over-union of every box of ``boxes_a`` with every box of ``boxes_b``."""
+    boxes_a = boxes_a.astype(np.float64)
+    boxes_b = boxes_b.astype(np.float64)
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    intersection = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=intersection > 0)
+
+def non_max_suppression(boxes, scores, threshold=NMS_IOU_THRESHOLD):
+    """Indices of the boxes kept by greedy NMS, highest score first."""
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while len(order):
+        best, order = order[0], order[1:]
+        keep.append(best)
+        if len(order):
+            order = order[iou_matrix(boxes[best:best + 1], boxes[order])[0] < threshold]
+    return np.array(keep, dtype=int)
+
+@dataclass
+class PreparedImage:
+    """A downloaded image, decoded at reduced size, plus the model input shared by both models."""
+    img: object  # PIL image the annotations are drawn on
+    input: np.ndarray  # (3, YOLO_INPUT_SIZE, YOLO_INPUT_SIZE) float32
+    ratio: float
+    pad: tuple
+
+def prepare_image(data):
+    img = decode_image(data, settings.YOLO_DECODE_MAX_SIDE)
+    model_input, ratio, pad = letterbox(img, settings.YOLO_INPUT_SIZE)
+    return PreparedImage(img, model_input, ratio, pad)
+
+def fetch_image(image_url):
+    """(sha256 of the content, image bytes) of an uploaded image, within the size and time limits."""
+    data = download_image(image_url, settings.YOLO_IMAGE_MAX_BYTES, settings.YOLO_DOWNLOAD_TIMEOUT_SECONDS)
+    return hashlib.sha256(data).hexdigest(), data
+
+# Results by image content hash, so re-sent images skip download-to-upload work
+_results = OrderedDict()
+_results_lock = threading.Lock()
+
+def cached_result(content_hash):
+    with _results_lock:
+        result = _results.get(content_hash)
+        if result is not None:
+            _results.move_to_end(content_hash)
+        return result
+
+def remember_result(content_hash, result):
+    if "error" in result:
+        return
+    with _results_lock:
+        _results[content_hash] = result
+        _results.move_to_end(content_hash)
+        while len(_results) > settings.YOLO_RESULT_CACHE_SIZE:
+            _results.popitem(last=False)
+
+def parse_detections(prediction, prepared, label_map=None):
+    """Detections above the confidence threshold from a ``run_model`` result, in image coordinates."""
+    boxes, names = prediction
+    boxes = boxes[boxes[:, 4] >= CONFIDENCE_THRESHOLD]
+    labels = [names[int(cls_id)] for cls_id in boxes[:, 5]]
+    if label_map:
+        labels = [label_map.get(label, label) for label in labels]
+    width, height = prepared.img.size
+    return Detections(
+        boxes=unletterbox_boxes(boxes[:, :4], prepared.ratio, prepared.pad, width, height).astype(int),
+        confidence=boxes[:, 4].astype(np.float64).round(2),
+        labels=np.array(labels, dtype=object),
+    )
+
+def draw_detections(img_array, detections, color, label_prefix="", below=False, font_scale=0.6):
+    for (x1, y1, x2, y2), label in zip(detections.boxes.tolist(), detections.labels):
+        cv2.rectangle(img_array, (x1, y1), (x2, y2), color, 2)
+        cv2.putText(img_array, f"{label_prefix}{label}", (x1, y2 + 15) if below else (x1, y1 - 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, font_scale, color, 2)
+
+def annotate(img, wire_detections, best_detections):
+    """Draw the detections that are reported. Returns (JPEG bytes, [(label, location)])."""
     img_array = np.array(img)
     height, width, _ = img_array.shape
 
-    results_best = model_best(img)[0]
-    results_wire = model_wire(img)[0]
-
-    detections = []
-
-    wire_detections = []
-    for box in results_wire.boxes:
-        conf = float(box.conf)
-        if conf < 0.25:
-            continue
-
-        cls_id = int(box.cls)
-        class_name = model_wire.names[cls_id]
-
-        x1, y1, x2, y2 = map(int, box.xyxy[0])
-        x_center = (x1 + x2) // 2
-        y_center = (y1 + y2) // 2
-        location = get_location_label(x_center, y_center, width, height)
-
-        wire_detections.append({
-            "label": class_name,
-            "location": location,
-            "confidence": round(conf, 2),
-            "box": {"x1": x1, "y1": y1, "x2": x2, "y2": y2}
-        })
-
     # If there are wire detections, prioritize them
-    if wire_detections:
+    if len(wire_detections):
         # Filter overlapping wire detections (non-maximum suppression by IOU)
-        final_detections = []
-        wire_detections.sort(key=lambda d: d["confidence"], reverse=True)
-
-        for det in wire_detections:
-            if all(iou(det["box"], kept["box"]) < 0.5 for kept in final_detections):
-                final_detections.append(det)
-                x1, y1, x2, y2 = det["box"].values()
-                label_text = f"Wire: {det['label']}"
-                cv2.rectangle(img_array, (x1, y1), (x2, y2), (255, 0, 0), 2)
-                cv2.putText(img_array, label_text, (x1, y2 + 15),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 2)
-
-        detections = final_detections
-
+        detections = wire_detections.select(non_max_suppression(wire_detections.boxes, wire_detections.confidence))
+        draw_detections(img_array, detections, (255, 0, 0), label_prefix="Wire: ", below=True, font_scale=0.5)
     else:
         # Fallback to best model detections
-        for box in results_best.boxes:
-            conf = float(box.conf)
-            if conf < 0.25:
-                continue
-
-            cls_id = int(box.cls)
-            class_name = model_best.names[cls_id]
-            english_label = LABEL_MAP.get(class_name, class_name)
-
-            x1, y1, x2, y2 = map(int, box.xyxy[0])
-            x_center = (x1 + x2) // 2
-            y_center = (y1 + y2) // 2
-            location = get_location_label(x_center, y_center, width, height)
-
-            detections.append({
-                "label": english_label,
-                "location": location,
-                "confidence": round(conf, 2),
-                "box": {"x1": x1, "y1": y1, "x2": x2, "y2": y2}
-            })
-
-            cv2.rectangle(img_array, (x1, y1), (x2, y2), (0, 255, 0), 2)
-            cv2.putText(img_array, english_label, (x1, y1 - 10),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-
-    # Upload the annotated image
+        detections = best_detections
+        draw_detections(img_array, detections, (0, 255, 0))
+
     is_success, buffer = cv2.imencode(".jpg", cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR))
     if not is_success:
-        return {"error": "Failed to encode annotated image"}
-
-    files = {"file": BytesIO(buffer.tobytes())}
-    data = {"upload_preset": UPLOAD_PRESET}
-    upload_res = requests.post(CLOUDINARY_URL, files=files, data=data)
+        raise ValueError("Failed to encode annotated image")
 
-    if upload_res.status_code != 200:
-        return {"error": "Cloudinary upload failed", "details": upload_res.json()}
+    locations = location_labels(detections.boxes, width, height)
+    return buffer.tobytes(), list(zip(detections.labels.tolist(), locations.tolist()))
 
-    annotated_url = upload_res.json().get("secure_url")
-
-    return {
-        "detections": [(det["label"], det["location"]) for det in detections],
-        "annotated_image_url": annotated_url
-    }
+def detect_yolo(image_url):
+    """Blocking detection of one image, without batching (scripts and tests)."""
+    content_hash, data = fetch_image(image_url)
+    result = cached_result(content_hash)
+    if result is not None:
+        return result
+    prepared = prepare_image(data)
+    del data
+
+    wire_detections = parse_detections(run_model("wire", [prepared.input])[0], prepared)
+    # The best model's boxes are only used when the wire model finds nothing
+    best_detections = None if len(wire_detections) else parse_detections(
+        run_model("best", [prepared.input])[0], prepared, LABEL_MAP
+    )
+    try:
+        jpeg, detections = annotate(prepared.img, wire_detections, best_detections)
+        annotated_url = annotation_uploads.store.upload(content_key(jpeg), jpeg, "jpg")
+    except Exception as e:
+        return {"error": f"Failed to annotate or upload image: {str(e)}"}
+
+    result = {"detections": detections, "annotated_image_url": annotated_url}
+    remember_result(content_hash, result)
+    return result
+
+async def detect_yolo_async(image_url):
+    """Detection of one image through the batched inference service."""
+    content_hash, data = await asyncio.to_thread(fetch_image, image_url)
+    result = cached_result(content_hash)
+    if result is not None:
+        return result
+    prepared = await asyncio.to_thread(prepare_image, data)
+    del data
+
+    wire_detections = parse_detections(await inference.predict("wire", prepared.input), prepared)
+    if len(wire_detections):
+        inference.skip("best")
+        best_detections = None
+    else:
+        best_detections = parse_detections(await inference.predict("best", prepared.input), prepared, LABEL_MAP)
+    jpeg, detections = await asyncio.to_thread(annotate, prepared.img, wire_detections, best_detections)
+
+    # The URL is final right away; the upload overlaps with the assistant run (see ``annotation_uploads.wait``).
+    # The result is only cached once that upload succeeded, so a failed one is retried on the next request.
+    result = {"detections": detections}
+    result["annotated_image_url"] = annotation_uploads.submit(
+        jpeg, on_uploaded=lambda url: remember_result(content_hash, result)
+    )
+    return result
@@ -0,0 +1,41 @@
+import argparse
+import os
+from pathlib import Path
+
+from app.config import settings
+from app.merged_index import QUANTIZATIONS, build_merged_index, shard_dirs
+
+# Usage: python -m scripts.build_merged_index --machine WLOL60H
+#        python -m scripts.build_merged_index --all
+#        python -m scripts.build_merged_index --machine WLOL60H --quantization sq8
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge per-PDF FAISS shards into one index per machine.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--machine", action="append", help="Machine folder under the index root (repeatable)")
+    group.add_argument("--all", action="store_true", help="Merge every machine that has per-PDF shards")
+    parser.add_argument(
+        "--quantization", choices=QUANTIZATIONS,
+        help="Vector storage (default: MERGED_QUANTIZATIONS / MERGED_QUANTIZATION per machine)",
+    )
+    parser.add_argument("--min-recall", type=float, help="Recall@10 a quantized index must reach against its float32 counterpart (default: MERGED_MIN_RECALL)")
+    args = parser.parse_args()
+
+    root = settings.FAISS_INDEX_ROOT
+    machines = args.machine or sorted(
+        name for name in os.listdir(root) if os.path.isdir(os.path.join(root, name))
+    )
+
+    for machine_name in machines:
+        machine_dir = os.path.join(root, machine_name)
+        if not shard_dirs(Path(machine_dir)):
+            print(f"⚠️ Skipping {machine_name}: no per-PDF shards.")
+            continue
+        print(f"🔨 Merging shards for {machine_name}...")
+        merged_dir = build_merged_index(machine_dir, args.quantization, args.min_recall)
+        print(f"✅ Saved merged index to {merged_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import argparse
+import asyncio
+import sys
+from datetime import datetime
+
+from app.conversation_archive import FORMATS, export_conversations, import_conversations
+from app.db import close_pool, get_pool
+
+# Usage:
+#   python -m scripts.conversations export --format csv --start 2025-01-01 --end 2025-02-01 -o january.csv
+#   python -m scripts.conversations export --thread-id <uuid> > thread.ndjson
+#   python -m scripts.conversations import --format csv january.csv
+
+
+async def run_export(args):
+    pool = await get_pool()
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        async for chunk in export_conversations(pool, args.format, thread_id=args.thread_id, start=args.start, end=args.end):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+
+
+async def run_import(args):
+    pool = await get_pool()
+    with open(args.file, "rb") as f:
+        imported = await import_conversations(pool, f, args.format, batch_size=args.batch_size)
+    print(f"✅ Imported {imported} conversation messages from {args.file}", file=sys.stderr)
+
+
+async def main(args):
+    try:
+        await (run_export(args) if args.command == "export" else run_import(args))
+    finally:
+        await close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk export/import of the conversations table using COPY.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="Stream conversations out as NDJSON or CSV")
+    export_parser.add_argument("--format", choices=sorted(FORMATS), default="ndjson")
+    export_parser.add_argument("--thread-id")
+    export_parser.add_argument("--start", type=datetime.fromisoformat, help="Inclusive ISO date/time")
+    export_parser.add_argument("--end", type=datetime.fromisoformat, help="Exclusive ISO date/time")
+    export_parser.add_argument("-o", "--output", help="Output file (default: stdout)")
+
+    import_parser = commands.add_parser("import", help="Bulk-load an NDJSON or CSV export")
+    import_parser.add_argument("file")
+    import_parser.add_argument("--format", choices=sorted(FORMATS), default="ndjson")
+    import_parser.add_argument("--batch-size", type=int, default=5000)
+
+    asyncio.run(main(parser.parse_args()))
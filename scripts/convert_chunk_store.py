@@ -0,0 +1,52 @@
+import argparse
+import os
+import pickle
+
+from app.chunk_store import CHUNKS_FILE, PICKLE_FILE, ChunkStore, write_chunk_store
+from app.config import settings
+
+# Usage: python -m scripts.convert_chunk_store [--root data/faiss_index] [--remove-pickle]
+
+
+def convert_dir(index_dir, remove_pickle=False):
+    """Convert one index.pkl id → text mapping to index.chunks and verify it."""
+    pickle_path = os.path.join(index_dir, PICKLE_FILE)
+    chunks_path = os.path.join(index_dir, CHUNKS_FILE)
+
+    with open(pickle_path, "rb") as f:
+        id_to_text = pickle.load(f)
+    write_chunk_store(chunks_path, id_to_text)
+
+    store = ChunkStore(chunks_path)
+    if any(store.get(i) != text for i, text in id_to_text.items()):
+        os.remove(chunks_path)
+        raise ValueError(f"Round-trip check failed for {pickle_path}")
+
+    if remove_pickle:
+        os.remove(pickle_path)
+    return len(id_to_text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert index.pkl text mappings to memory-mapped index.chunks files.")
+    parser.add_argument("--root", default=settings.FAISS_INDEX_ROOT, help="Index tree to convert")
+    parser.add_argument("--remove-pickle", action="store_true", help="Delete index.pkl after a verified conversion")
+    args = parser.parse_args()
+
+    converted = failed = 0
+    for dirpath, _, files in os.walk(args.root):
+        if PICKLE_FILE not in files:
+            continue
+        try:
+            count = convert_dir(dirpath, remove_pickle=args.remove_pickle)
+            converted += 1
+            print(f"✅ {dirpath}: {count} chunks")
+        except Exception as e:
+            failed += 1
+            print(f"❌ Failed to convert {dirpath}: {e}")
+
+    print(f"\nConverted {converted} mappings, {failed} failed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,18 @@
+import asyncio
 import os
 import pickle
+import backoff
 import faiss
-from openai import OpenAI
+import openai
+from openai import AsyncOpenAI
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 import numpy as np
-from PyPDF2 import PdfReader
 from dotenv import load_dotenv
 
+from app.embedding_batcher import EmbeddingBatcher
+from app.pdf_chunks import iter_pdf_chunks
+
 load_dotenv()
 
 # === CONFIGURATION ===
@@ -17,29 +22,26 @@ TEXT_MAP_PATH = "data/faiss_index/id_to_text.pkl"
 CHUNK_SIZE = 500
 CHUNK_OVERLAP = 100
 
-def get_embedding(text: str, model="text-embedding-ada-002"):
-    text = text.replace("\n", " ")  
-    response = client.embeddings.create(input=[text], model=model)
-    return response.data[0].embedding
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+@backoff.on_exception(
+    backoff.expo,
+    (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError),
+    max_tries=6,
+)
+async def get_embeddings_batch(texts, model=EMBEDDING_MODEL):
+    response = await client.embeddings.create(input=texts, model=model)
+    return [r.embedding for r in response.data]
 
 # === STEP 1: Read and Chunk PDF ===
 def read_pdf_chunks(path):
-    reader = PdfReader(path)
-    all_text = " ".join([page.extract_text() or "" for page in reader.pages])
-    chunks = []
-    for i in range(0, len(all_text), CHUNK_SIZE - CHUNK_OVERLAP):
-        chunks.append(all_text[i:i + CHUNK_SIZE])
-    return chunks
+    return [chunk.text for chunk in iter_pdf_chunks(path, CHUNK_SIZE, CHUNK_OVERLAP)]
 
 # === STEP 2: Embed Chunks ===
 def embed_chunks(chunks):
-    embeddings = []
-    for i, chunk in enumerate(chunks):
-        try:
-            emb = get_embedding(chunk, model="text-embedding-ada-002")
-            embeddings.append((i, emb))
-        except Exception as e:
-            print(f"Skipping chunk {i}: {e}")
+    batcher = EmbeddingBatcher(get_embeddings_batch, EMBEDDING_MODEL)
+    embeddings = asyncio.run(batcher.embed(chunks))
+    print(f"Embedded {len(embeddings)}/{len(chunks)} chunks: {batcher.stats()}")
     return embeddings
 
 # === STEP 3: Build FAISS Index ===
@@ -1,59 +1,65 @@
+import argparse
+import asyncio
+import hashlib
+import json
 import os
-import pickle
+import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import backoff
 import faiss
 import numpy as np
-from openai import OpenAI
-from PyPDF2 import PdfReader
+import openai
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from app.chunk_store import CHUNKS_FILE, PICKLE_FILE, write_chunk_store
+from app.embedding_batcher import EmbeddingBatcher
+from app.merged_index import build_merged_index
+from app.pdf_chunks import iter_pdf_chunks
+from app.rate_limiter import RateLimiter
+
+# Usage: python -m scripts.create_every --machine WLOL60H
+#        python -m scripts.create_every --all --workers 8 --concurrency 16 --merge
+# Unchanged PDFs are skipped (see MANIFEST_FILE); --force rebuilds everything.
 
 # === Load environment ===
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 # === CONFIGURATION ===
 PDFS_ROOT = "data/manuals"
 INDEX_ROOT = "data/faiss_index"
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
-BATCH_SIZE = 20
 EMBEDDING_MODEL = "text-embedding-ada-002"
+EXTRACTOR = "pymupdf"
+MANIFEST_FILE = "ingest_manifest.json"  # per machine, next to its shards
+PAGES_FILE = "index.pages.json"  # [first_page, last_page] of each chunk id
 
 # === Functions ===
 
-def get_embeddings_batch(texts, model=EMBEDDING_MODEL):
-    cleaned_texts = [t.replace("\n", " ") for t in texts]
-    response = client.embeddings.create(input=cleaned_texts, model=model)
+@backoff.on_exception(
+    backoff.expo,
+    (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError),
+    max_tries=6,
+)
+async def get_embeddings_batch(texts, model=EMBEDDING_MODEL):
+    response = await client.embeddings.create(input=texts, model=model)
     return [r.embedding for r in response.data]
 
 def read_pdf_chunks(pdf_path):
+    """Extract and split one PDF page by page (runs in a worker process)."""
     try:
-        reader = PdfReader(pdf_path)
-        text = " ".join([page.extract_text() or "" for page in reader.pages])
-        if not text.strip():
-            print(f"⚠️ Skipping {pdf_path}: no extractable text.")
-            return []
+        chunks = list(iter_pdf_chunks(pdf_path, CHUNK_SIZE, CHUNK_OVERLAP))
     except Exception as e:
         print(f"❌ Failed to read {pdf_path}: {e}")
         return []
-
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=CHUNK_SIZE,
-        chunk_overlap=CHUNK_OVERLAP,
-        separators=["\n\n", "\n", ".", " ", ""]
-    )
-    return splitter.split_text(text)
-
-def embed_chunks(chunks):
-    embeddings = []
-    for i in range(0, len(chunks), BATCH_SIZE):
-        batch = chunks[i:i + BATCH_SIZE]
-        try:
-            batch_embeddings = get_embeddings_batch(batch)
-            embeddings.extend([(i + j, emb) for j, emb in enumerate(batch_embeddings)])
-        except Exception as e:
-            print(f"❌ Error embedding batch at chunk {i}: {e}")
-    return embeddings
+    if not chunks:
+        print(f"⚠️ Skipping {pdf_path}: no extractable text.")
+    return chunks
 
 def build_faiss_index(embeddings):
     dim = len(embeddings[0][1])
@@ -62,6 +68,103 @@ def build_faiss_index(embeddings):
     index.add(vectors)
     return index
 
+def write_shard(index_dir, chunks, embeddings):
+    os.makedirs(index_dir, exist_ok=True)
+    index = build_faiss_index(embeddings)
+    id_to_text = {
+        global_id: chunks[local_id].text
+        for global_id, (local_id, _) in enumerate(embeddings)
+    }
+    pages = [[chunks[local_id].first_page, chunks[local_id].last_page] for local_id, _ in embeddings]
+    faiss.write_index(index, os.path.join(index_dir, "index.faiss"))
+    write_chunk_store(os.path.join(index_dir, CHUNKS_FILE), id_to_text)
+    with open(os.path.join(index_dir, PAGES_FILE), "w", encoding="utf-8") as f:
+        json.dump(pages, f)
+    legacy_pickle = os.path.join(index_dir, PICKLE_FILE)
+    if os.path.exists(legacy_pickle):
+        os.remove(legacy_pickle)
+
+def chunking_params():
+    """Everything besides the PDF itself that determines a shard's content."""
+    return {
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "embedding_model": EMBEDDING_MODEL,
+        "extractor": EXTRACTOR,
+    }
+
+def shard_name(key):
+    """Shard directory for a PDF, given its path relative to the machine folder.
+
+    PDFs at the top level keep their file name; nested ones get their folders
+    prefixed and a short hash of the relative path, so same-named PDFs in
+    different subfolders never share a shard.
+    """
+    stem = os.path.splitext(key)[0]
+    parts = [part for part in re.split(r"[\\/]+", stem) if part]
+    if len(parts) == 1:
+        return parts[0]
+    digest = hashlib.sha256("/".join(parts).encode("utf-8")).hexdigest()[:8]
+    return f"{'__'.join(parts)}-{digest}"
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class IngestManifest:
+    """What was indexed from which PDF: content hash, chunking parameters, embedding model and shard.
+
+    Saved after every shard that is fully written, so an interrupted run resumes
+    where it stopped.
+    """
+
+    def __init__(self, index_root):
+        self.path = os.path.join(index_root, MANIFEST_FILE)
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.documents = json.load(f)["documents"]
+        except FileNotFoundError:
+            self.documents = {}
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"documents": self.documents}, f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def is_current(self, key, pdf_path, index_root):
+        """Whether the shard recorded for a PDF is complete and still matches it."""
+        entry = self.documents.get(key)
+        if entry is None or {k: entry.get(k) for k in chunking_params()} != chunking_params():
+            return False
+        if entry.get("shard") != shard_name(key):
+            return False
+        index_dir = os.path.join(index_root, entry["shard"])
+        if not os.path.exists(os.path.join(index_dir, "index.faiss")) or not os.path.exists(os.path.join(index_dir, CHUNKS_FILE)):
+            return False
+        stat = os.stat(pdf_path)
+        if entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return True
+        # Touched but maybe not changed: compare contents
+        if entry["sha256"] != file_sha256(pdf_path):
+            return False
+        entry["mtime_ns"] = stat.st_mtime_ns
+        return True
+
+    def record(self, key, sha256, stat, shard, chunks):
+        self.documents[key] = {
+            "sha256": sha256,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "shard": shard,
+            "chunks": chunks,
+            "indexed_at": datetime.now(timezone.utc).isoformat(),
+            **chunking_params(),
+        }
+
 def find_all_pdfs(root_dir):
     return [
         os.path.join(dirpath, file)
@@ -70,60 +173,114 @@ def find_all_pdfs(root_dir):
         if file.lower().endswith(".pdf")
     ]
 
-def process_machine(machine_name):
+async def process_machine(machine_name, pool, batcher, max_documents_in_flight, force=False):
+    """Parse (process pool), embed (concurrent requests) and write (thread) the new or changed PDFs of a machine.
+
+    The three stages overlap across documents; at most ``max_documents_in_flight``
+    documents are held in memory at once. Shards of deleted PDFs are removed.
+    Returns the number of shards written or removed.
+    """
     print(f"\n🔧 Processing machine: {machine_name}")
     pdf_dir = os.path.join(PDFS_ROOT, machine_name)
     index_root = os.path.join(INDEX_ROOT, machine_name)
+    if not os.path.isdir(pdf_dir):
+        print(f"⚠️ No PDF folder at {os.path.abspath(pdf_dir)}")
+        return 0
     os.makedirs(index_root, exist_ok=True)
 
-    print("🔍 cwd:", os.getcwd())
-    print("🔍 PDFS_ROOT →", os.path.abspath(PDFS_ROOT))
-    print("🔍 looking in:", os.path.abspath(pdf_dir))
-    print("🔍 exists?", os.path.isdir(pdf_dir))
-    if os.path.isdir(pdf_dir):
-        print("🔍 contains:", os.listdir(pdf_dir))
-
-
     pdf_files = find_all_pdfs(pdf_dir)
-    print(f"📄 Found {len(pdf_files)} PDFs.")
+    manifest = IngestManifest(index_root)
+    keys = {os.path.relpath(p, pdf_dir): p for p in pdf_files}
+    current_shards = {shard_name(key) for key in keys}
 
-    for pdf_path in pdf_files:
-        pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
-        print(f"\n→ Reading PDF: {pdf_name}")
+    removed = 0
+    for key in sorted(set(manifest.documents) - set(keys)):
+        shard = manifest.documents.pop(key)["shard"]
+        if shard in current_shards:
+            continue  # recorded before shard names were unique; the directory belongs to another PDF now
+        shutil.rmtree(os.path.join(index_root, shard), ignore_errors=True)
+        print(f"🗑️ Removed shard {shard} ({key} was deleted)")
+        removed += 1
 
-        chunks = read_pdf_chunks(pdf_path)
-        if not chunks:
-            continue
+    pending = {
+        key: pdf_path for key, pdf_path in keys.items()
+        if force or not manifest.is_current(key, pdf_path, index_root)
+    }
+    if manifest.documents or removed:
+        manifest.save()  # removals and refreshed mtimes
+    print(f"📄 Found {len(pdf_files)} PDFs, {len(pending)} new or changed.")
 
-        print(f"   Embedding {len(chunks)} chunks...")
-        embeddings = embed_chunks(chunks)
+    loop = asyncio.get_running_loop()
+    in_flight = asyncio.Semaphore(max_documents_in_flight)
+    manifest_lock = asyncio.Lock()
 
-        if not embeddings:
-            print(f"⚠️ Skipping {pdf_name}: no valid embeddings.")
-            continue
+    async def process_pdf(key, pdf_path):
+        shard = shard_name(key)
+        async with in_flight:
+            # Hashed before parsing, so a PDF replaced mid-run is picked up again next time
+            stat = os.stat(pdf_path)
+            sha256 = await asyncio.to_thread(file_sha256, pdf_path)
+            chunks = await loop.run_in_executor(pool, read_pdf_chunks, pdf_path)
+            if not chunks:
+                return False
 
-        index_dir = os.path.join(index_root, pdf_name)
-        os.makedirs(index_dir, exist_ok=True)
+            embeddings = await batcher.embed([chunk.text for chunk in chunks])
+            if not embeddings:
+                print(f"⚠️ Skipping {key}: no valid embeddings.")
+                return False
 
-        print(f"🔨 Building FAISS index for {pdf_name}...")
-        index = build_faiss_index(embeddings)
-
-        id_to_text = {
-            global_id: chunks[local_id]
-            for global_id, (local_id, _) in enumerate(embeddings)
-        }
+            index_dir = os.path.join(index_root, shard)
+            await asyncio.to_thread(write_shard, index_dir, chunks, embeddings)
+            if len(embeddings) < len(chunks):
+                # Incomplete shard: keep it, but leave it out of the manifest so the next run retries it
+                print(f"⚠️ {key}: only {len(embeddings)}/{len(chunks)} chunks indexed")
+                return True
 
-        print(f"💾 Saving index to {index_dir}...")
-        faiss.write_index(index, os.path.join(index_dir, "index.faiss"))
-        with open(os.path.join(index_dir, "index.pkl"), "wb") as f:
-            pickle.dump(id_to_text, f)
+            async with manifest_lock:
+                previous = manifest.documents.get(key, {}).get("shard")
+                manifest.record(key, sha256, stat, shard, len(chunks))
+                await asyncio.to_thread(manifest.save)
+            if previous and previous not in current_shards:
+                # Indexed under an old, possibly colliding name
+                shutil.rmtree(os.path.join(index_root, previous), ignore_errors=True)
+            print(f"✅ {key}: {len(chunks)} chunks indexed into {shard}")
+            return True
 
-        print(f"✅ Finished processing: {pdf_name}")
+    written = await asyncio.gather(*(process_pdf(key, p) for key, p in pending.items()))
+    return sum(written) + removed
 
+async def run(machines, workers, concurrency, requests_per_minute, tokens_per_minute, merge, force):
+    batcher = EmbeddingBatcher(
+        get_embeddings_batch, EMBEDDING_MODEL, RateLimiter(requests_per_minute, tokens_per_minute), concurrency
+    )
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for machine_name in machines:
+            changed = await process_machine(
+                machine_name, pool, batcher, max_documents_in_flight=workers + concurrency, force=force
+            )
+            print(f"📦 {machine_name}: {changed} shards written or removed.")
+            if merge and changed:
+                merged_dir = await asyncio.to_thread(build_merged_index, os.path.join(INDEX_ROOT, machine_name))
+                print(f"✅ Saved merged index to {merged_dir}")
+    print(f"📊 Embedding requests: {batcher.stats()}")
 
 def main():
-    machine_name = "WLO70H"  # 👈 Change this to target a different folder
-    process_machine(machine_name)
+    parser = argparse.ArgumentParser(description="Build per-PDF FAISS shards for machine manuals.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--machine", action="append", help="Machine folder under data/manuals (repeatable)")
+    group.add_argument("--all", action="store_true", help="Every machine folder under data/manuals")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="PDF parsing processes")
+    parser.add_argument("--concurrency", type=int, default=8, help="Embedding requests in flight")
+    parser.add_argument("--rpm", type=float, default=3000, help="Embedding requests per minute")
+    parser.add_argument("--tpm", type=float, default=1_000_000, help="Embedding tokens per minute")
+    parser.add_argument("--merge", action="store_true", help="Rebuild each machine's merged index afterwards")
+    parser.add_argument("--force", action="store_true", help="Re-index every PDF, even unchanged ones")
+    args = parser.parse_args()
+
+    machines = args.machine or sorted(
+        name for name in os.listdir(PDFS_ROOT) if os.path.isdir(os.path.join(PDFS_ROOT, name))
+    )
+    asyncio.run(run(machines, args.workers, args.concurrency, args.rpm, args.tpm, args.merge, args.force))
 
 if __name__ == "__main__":
     main()
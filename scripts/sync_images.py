@@ -0,0 +1,54 @@
+import argparse
+import os
+from datetime import datetime, timezone
+
+from app.config import settings
+from app.utils.image_manifest import IMAGE_EXTENSIONS, read_manifest, write_manifest
+from app.utils.image_store import content_key, create_image_store
+
+# Usage: python -m scripts.sync_images
+#        python -m scripts.sync_images --backend local --force
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload manual figures and record their URLs in the image manifest.")
+    parser.add_argument("--images-dir", default="data/static/images")
+    parser.add_argument("--manifest", default=settings.IMAGE_MANIFEST_PATH)
+    parser.add_argument("--backend", help="Image store to upload to (default: IMAGE_STORE_BACKEND)")
+    parser.add_argument("--force", action="store_true", help="Re-upload images whose content did not change")
+    args = parser.parse_args()
+
+    store = create_image_store(args.backend)
+    manifest = read_manifest(args.manifest)
+    previous = manifest.get("images", {})
+    images = {}
+    uploaded = 0
+
+    for filename in sorted(os.listdir(args.images_dir)):
+        if not filename.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        with open(os.path.join(args.images_dir, filename), "rb") as f:
+            data = f.read()
+        sha256 = content_key(data)
+        ext = filename.rsplit(".", 1)[1].lower()
+
+        entry = previous.get(filename)
+        if entry and entry["sha256"] == sha256 and entry["url"] == store.url_for(sha256, ext) and not args.force:
+            images[filename] = entry
+            continue
+
+        print(f"⬆️ Uploading {filename}...")
+        url = store.upload(sha256, data, ext)
+        images[filename] = {"sha256": sha256, "url": url, "bytes": len(data)}
+        uploaded += 1
+
+    removed = sorted(set(previous) - set(images))
+    write_manifest(args.manifest, {
+        "synced_at": datetime.now(timezone.utc).isoformat(),
+        "images": images,
+    })
+    print(f"✅ {len(images)} images in {args.manifest} ({uploaded} uploaded, {len(removed)} removed)")
+
+
+if __name__ == "__main__":
+    main()
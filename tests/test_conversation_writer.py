@@ -0,0 +1,187 @@
+import asyncio
+import os
+from datetime import datetime, timezone
+from uuid import uuid4
+
+import asyncpg
+
+import app.conversation_writer as conversation_writer
+from app.conversation_writer import ConversationWriter
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def copy_records_to_table(self, table, records, columns):
+        if self.pool.error is not None:
+            raise self.pool.error
+        rejected = [r for r in records if r[3] == "bad"]
+        if rejected:
+            raise asyncpg.DataError("invalid input")
+        self.pool.rows.extend(records)
+
+
+class FakePool:
+    def __init__(self):
+        self.rows = []
+        self.error = None
+
+    def acquire(self):
+        pool = self
+
+        class Acquire:
+            async def __aenter__(self):
+                return FakeConnection(pool)
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return Acquire()
+
+
+def make_row(message="hello"):
+    return (str(uuid4()), None, "user", message, None, datetime.now(timezone.utc))
+
+
+def make_writer(tmp_path):
+    return ConversationWriter(
+        batch_size=10,
+        flush_interval=0.01,
+        max_queue=100,
+        spill_path=str(tmp_path / "pending.jsonl"),
+        dead_letter_path=str(tmp_path / "rejected.jsonl"),
+    )
+
+
+def use_pool(monkeypatch, pool):
+    async def get_pool():
+        return pool
+
+    monkeypatch.setattr(conversation_writer, "get_pool", get_pool)
+
+
+def test_spill_is_replayed_by_one_worker_only(tmp_path, monkeypatch):
+    spill_path = str(tmp_path / "pending.jsonl")
+    ConversationWriter._write_jsonl(spill_path, [make_row() for _ in range(3)])
+    monkeypatch.setattr(conversation_writer, "_process_alive", lambda pid: True)
+
+    monkeypatch.setattr(os, "getpid", lambda: 1001)
+    first = make_writer(tmp_path)._load_spill()
+    monkeypatch.setattr(os, "getpid", lambda: 1002)
+    second = make_writer(tmp_path)._load_spill()
+
+    assert len(first) == 3
+    assert second == []
+    assert sorted(os.listdir(tmp_path)) == ["pending.jsonl.1001.replay"]
+
+
+def test_replay_file_of_a_dead_worker_is_claimed(tmp_path, monkeypatch):
+    spill_path = str(tmp_path / "pending.jsonl")
+    ConversationWriter._write_jsonl(spill_path + ".1001.replay", [make_row() for _ in range(2)])
+    ConversationWriter._write_jsonl(spill_path, [make_row()])
+    monkeypatch.setattr(conversation_writer, "_process_alive", lambda pid: pid != 1001)
+    monkeypatch.setattr(os, "getpid", lambda: 1002)
+
+    rows = make_writer(tmp_path)._load_spill()
+
+    assert len(rows) == 3
+    assert sorted(os.listdir(tmp_path)) == ["pending.jsonl.1002.replay"]
+
+
+def test_replay_of_a_live_worker_is_left_alone(tmp_path, monkeypatch):
+    spill_path = str(tmp_path / "pending.jsonl")
+    ConversationWriter._write_jsonl(spill_path + ".1001.replay", [make_row()])
+    monkeypatch.setattr(conversation_writer, "_process_alive", lambda pid: True)
+    monkeypatch.setattr(os, "getpid", lambda: 1002)
+
+    assert make_writer(tmp_path)._load_spill() == []
+    assert os.path.exists(spill_path + ".1001.replay")
+
+
+def test_replayed_rows_are_written_and_the_replay_file_removed(tmp_path, monkeypatch):
+    pool = FakePool()
+    use_pool(monkeypatch, pool)
+    spilled = [make_row() for _ in range(3)]
+    ConversationWriter._write_jsonl(str(tmp_path / "pending.jsonl"), spilled)
+
+    async def scenario():
+        writer = make_writer(tmp_path)
+        await writer.start()
+        await asyncio.sleep(0.1)
+        await writer.stop()
+        return writer
+
+    writer = asyncio.run(scenario())
+
+    assert [row[0] for row in pool.rows] == [row[0] for row in spilled]
+    assert writer.stats()["written"] == 3
+    assert os.listdir(tmp_path) == []
+
+
+def test_unwritten_rows_are_spilled_on_stop(tmp_path, monkeypatch):
+    pool = FakePool()
+    pool.error = OSError("connection refused")
+    use_pool(monkeypatch, pool)
+    spill_path = str(tmp_path / "pending.jsonl")
+    ConversationWriter._write_jsonl(spill_path, [make_row()])
+
+    async def scenario():
+        writer = make_writer(tmp_path)
+        await writer.start()
+        writer._queue.put_nowait(make_row())
+        await asyncio.sleep(0.05)
+        await writer.stop()
+
+    asyncio.run(scenario())
+
+    # Both the replayed and the new row are back in the shared spill file, once each
+    assert sorted(os.listdir(tmp_path)) == ["pending.jsonl"]
+    with open(spill_path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 2
+
+
+def test_rejected_rows_are_dead_lettered(tmp_path, monkeypatch):
+    pool = FakePool()
+    use_pool(monkeypatch, pool)
+    rows = [make_row(), make_row("bad"), make_row(), make_row()]
+
+    async def scenario():
+        writer = make_writer(tmp_path)
+        writer._pending = list(rows)
+        assert await writer._flush()
+        return writer
+
+    writer = asyncio.run(scenario())
+
+    assert len(pool.rows) == 3
+    assert writer.stats()["dead_lettered"] == 1
+    with open(tmp_path / "rejected.jsonl", encoding="utf-8") as f:
+        assert '"error": "invalid input"' in f.read()
+
+
+def test_writer_task_restarts_after_an_unexpected_error(tmp_path, monkeypatch):
+    pool = FakePool()
+    use_pool(monkeypatch, pool)
+    writer = make_writer(tmp_path)
+    flush = writer._flush
+    failures = []
+
+    async def flaky_flush():
+        if not failures:
+            failures.append(True)
+            raise RuntimeError("boom")
+        return await flush()
+
+    monkeypatch.setattr(writer, "_flush", flaky_flush)
+
+    async def scenario():
+        await writer.start()
+        writer._queue.put_nowait(make_row())
+        await asyncio.sleep(0.1)
+        await writer.stop()
+
+    asyncio.run(scenario())
+
+    assert failures
+    assert len(pool.rows) == 1
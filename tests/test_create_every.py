@@ -0,0 +1,104 @@
+import asyncio
+import os
+
+import scripts.create_every as create_every
+from scripts.create_every import CHUNKS_FILE, IngestManifest, file_sha256, process_machine, shard_name
+
+
+def write_pdf(path, content=b"%PDF-1.4 manual"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(content)
+
+
+def write_shard_files(index_dir):
+    os.makedirs(index_dir, exist_ok=True)
+    for name in ("index.faiss", CHUNKS_FILE):
+        with open(os.path.join(index_dir, name), "wb") as f:
+            f.write(b"shard")
+
+
+def index_pdf(manifest, index_root, key, pdf_path, shard=None):
+    shard = shard or shard_name(key)
+    write_shard_files(os.path.join(index_root, shard))
+    manifest.record(key, file_sha256(pdf_path), os.stat(pdf_path), shard, 1)
+
+
+def test_shard_names_of_same_named_pdfs_differ():
+    assert shard_name("manual.pdf") == "manual"
+    nested = {shard_name(os.path.join(folder, "manual.pdf")) for folder in ("engine", "hydraulics")}
+    assert len(nested) == 2
+    assert "manual" not in nested
+    assert shard_name("engine/manual.pdf") == shard_name("engine\\manual.pdf")
+
+
+def test_unchanged_pdf_is_current(tmp_path):
+    pdf_path = str(tmp_path / "manual.pdf")
+    write_pdf(pdf_path)
+    manifest = IngestManifest(str(tmp_path))
+    index_pdf(manifest, str(tmp_path), "manual.pdf", pdf_path)
+    manifest.save()
+
+    assert IngestManifest(str(tmp_path)).is_current("manual.pdf", pdf_path, str(tmp_path))
+
+
+def test_touched_pdf_is_current_but_edited_pdf_is_not(tmp_path):
+    pdf_path = str(tmp_path / "manual.pdf")
+    write_pdf(pdf_path)
+    manifest = IngestManifest(str(tmp_path))
+    index_pdf(manifest, str(tmp_path), "manual.pdf", pdf_path)
+
+    stat = os.stat(pdf_path)
+    os.utime(pdf_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert manifest.is_current("manual.pdf", pdf_path, str(tmp_path))
+    assert manifest.documents["manual.pdf"]["mtime_ns"] == stat.st_mtime_ns + 10**9
+
+    write_pdf(pdf_path, b"%PDF-1.4 revised manual")
+    assert not manifest.is_current("manual.pdf", pdf_path, str(tmp_path))
+
+
+def test_changed_chunking_or_missing_shard_is_not_current(tmp_path, monkeypatch):
+    pdf_path = str(tmp_path / "manual.pdf")
+    write_pdf(pdf_path)
+    manifest = IngestManifest(str(tmp_path))
+    index_pdf(manifest, str(tmp_path), "manual.pdf", pdf_path)
+
+    monkeypatch.setattr(create_every, "CHUNK_SIZE", create_every.CHUNK_SIZE + 1)
+    assert not manifest.is_current("manual.pdf", pdf_path, str(tmp_path))
+    monkeypatch.undo()
+
+    os.remove(os.path.join(str(tmp_path), "manual", "index.faiss"))
+    assert not manifest.is_current("manual.pdf", pdf_path, str(tmp_path))
+
+
+def test_pdf_recorded_under_its_basename_is_reindexed(tmp_path):
+    key = os.path.join("engine", "manual.pdf")
+    pdf_path = str(tmp_path / key)
+    write_pdf(pdf_path)
+    manifest = IngestManifest(str(tmp_path))
+    index_pdf(manifest, str(tmp_path), key, pdf_path, shard="manual")
+
+    assert not manifest.is_current(key, pdf_path, str(tmp_path))
+
+
+def test_deleting_a_pdf_keeps_the_shard_of_its_namesake(tmp_path, monkeypatch):
+    pdfs_root, index_root = tmp_path / "manuals", tmp_path / "faiss_index"
+    monkeypatch.setattr(create_every, "PDFS_ROOT", str(pdfs_root))
+    monkeypatch.setattr(create_every, "INDEX_ROOT", str(index_root))
+    machine_pdfs, machine_index = str(pdfs_root / "WLOL60H"), str(index_root / "WLOL60H")
+    keys = [os.path.join("engine", "manual.pdf"), os.path.join("hydraulics", "manual.pdf")]
+    os.makedirs(machine_index)
+    manifest = IngestManifest(machine_index)
+    for key in keys:
+        write_pdf(os.path.join(machine_pdfs, key))
+        index_pdf(manifest, machine_index, key, os.path.join(machine_pdfs, key))
+    manifest.save()
+
+    os.remove(os.path.join(machine_pdfs, keys[1]))
+    # Nothing is pending, so neither the process pool nor the embedder is used
+    changed = asyncio.run(process_machine("WLOL60H", pool=None, batcher=None, max_documents_in_flight=1))
+
+    assert changed == 1
+    assert os.path.isdir(os.path.join(machine_index, shard_name(keys[0])))
+    assert not os.path.exists(os.path.join(machine_index, shard_name(keys[1])))
+    assert list(IngestManifest(machine_index).documents) == [keys[0]]
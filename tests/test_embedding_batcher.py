@@ -0,0 +1,38 @@
+import asyncio
+
+from app.embedding_batcher import EmbeddingBatcher, pack_batches
+
+
+def test_batches_respect_token_and_input_limits():
+    assert pack_batches([3, 3, 3, 3], max_tokens=6, max_inputs=10) == [[0, 1], [2, 3]]
+    assert pack_batches([1, 1, 1], max_tokens=100, max_inputs=2) == [[0, 1], [2]]
+    # An input over the token limit still gets a batch of its own
+    assert pack_batches([2, 9, 2], max_tokens=5, max_inputs=10) == [[0], [1], [2]]
+
+
+def test_failed_batch_is_split_until_only_the_bad_input_is_lost():
+    requests = []
+
+    async def embed(texts):
+        requests.append(list(texts))
+        if "bad" in texts:
+            raise ValueError("invalid input")
+        return [[float(len(text))] for text in texts]
+
+    batcher = EmbeddingBatcher(embed, "text-embedding-ada-002", concurrency=2)
+    texts = ["oil", "level", "bad", "filter"]
+
+    embeddings = asyncio.run(batcher.embed(texts))
+
+    assert embeddings == [(0, [3.0]), (1, [5.0]), (3, [6.0])]
+    assert requests[0] == texts
+    assert batcher.stats() == {"requests": len(requests), "splits": 2, "failed": 1}
+
+
+def test_newlines_are_flattened_before_embedding():
+    batcher = EmbeddingBatcher(None, "text-embedding-ada-002")
+
+    text, tokens = batcher.prepare("Check the\noil level")
+
+    assert text == "Check the oil level"
+    assert tokens > 0
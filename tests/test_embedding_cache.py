@@ -0,0 +1,72 @@
+from array import array
+
+import app.embedding_cache as embedding_cache
+from app.embedding_cache import EmbeddingCache, normalize_query
+
+
+def make_cache(tmp_path, max_entries=4, max_disk_entries=100):
+    return EmbeddingCache(str(tmp_path / "embeddings.sqlite3"), max_entries, max_disk_entries)
+
+
+def disk_rows(cache):
+    return cache._connect().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+def test_queries_are_normalized():
+    assert normalize_query("  Oil   LEVEL\n") == "oil level"
+    assert normalize_query("ＯＩＬ") == "oil"
+
+
+def test_hits_return_float32_rounded_lists(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put("model", "oil level", [0.1, 0.2])
+
+    vector = cache.get("model", "Oil  level")
+
+    assert vector == array("f", [0.1, 0.2]).tolist()
+    assert isinstance(cache._memory[("model", cache._key("oil level"))], array)
+    assert cache.get("other-model", "oil level") is None
+    assert cache.stats()["memory_hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_memory_tier_is_bounded_and_falls_back_to_disk(tmp_path):
+    cache = make_cache(tmp_path, max_entries=2)
+    for i in range(3):
+        cache.put("model", f"query {i}", [float(i)])
+
+    assert len(cache._memory) == 2
+    assert cache.get("model", "query 0") == [0.0]
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_restarted_cache_starts_warm(tmp_path):
+    make_cache(tmp_path).put("model", "oil level", [0.5])
+
+    cache = make_cache(tmp_path)
+
+    assert cache.get("model", "oil level") == [0.5]
+    assert cache.stats()["memory_hits"] == 1
+
+
+def test_disk_tier_keeps_the_most_recently_used_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "PRUNE_EVERY", 1)
+    clock = iter(range(1, 100))
+    monkeypatch.setattr(embedding_cache.time, "time", lambda: next(clock))
+    cache = make_cache(tmp_path, max_entries=1, max_disk_entries=2)
+    cache.put("model", "query 0", [0.0])
+    cache.put("model", "query 1", [1.0])
+    cache.get("model", "query 0")  # disk hit: now more recently used than query 1
+    cache.put("model", "query 2", [2.0])
+
+    assert disk_rows(cache) == 2
+    assert make_cache(tmp_path, max_entries=0).get("model", "query 1") is None
+    assert make_cache(tmp_path, max_entries=0).get("model", "query 0") == [0.0]
+
+
+def test_disk_tier_is_pruned_on_open(tmp_path):
+    cache = make_cache(tmp_path, max_disk_entries=10)
+    for i in range(5):
+        cache.put("model", f"query {i}", [float(i)])
+
+    assert disk_rows(make_cache(tmp_path, max_disk_entries=3)) == 3
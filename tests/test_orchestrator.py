@@ -0,0 +1,144 @@
+import asyncio
+from types import SimpleNamespace
+
+import app.orchestrator as orchestrator
+from app.orchestrator import ReplyStream, RunTimeout, execute_run
+
+
+class FakeRuns:
+    def __init__(self):
+        self.created = []
+        self.submitted = []
+        self.cancelled = []
+
+    async def create(self, thread_id, assistant_id, **kwargs):
+        self.created.append(assistant_id)
+        return SimpleNamespace(id="run_new", status="queued")
+
+    async def submit_tool_outputs(self, thread_id, run_id, tool_outputs):
+        self.submitted.append((run_id, tool_outputs))
+
+    async def cancel(self, thread_id, run_id):
+        self.cancelled.append(run_id)
+
+
+class FakeMessages:
+    def __init__(self, text):
+        self.text = text
+
+    async def list(self, thread_id):
+        content = SimpleNamespace(text=SimpleNamespace(value=self.text))
+        return SimpleNamespace(data=[SimpleNamespace(content=[content])])
+
+
+def use_client(monkeypatch, runs=None, messages=None):
+    threads = SimpleNamespace(runs=runs, messages=messages)
+    monkeypatch.setattr(orchestrator, "client", SimpleNamespace(beta=SimpleNamespace(threads=threads)))
+
+
+def use_stream_run(monkeypatch, run=None, pending_outputs=None, error=ConnectionError("stream closed")):
+    async def stream_run(thread_id, assistant_id, session, run_state, deadline, emit=None, **run_kwargs):
+        if run is not None:
+            run_state["run"] = run
+        if pending_outputs is not None:
+            run_state["pending_outputs"] = pending_outputs
+        raise error
+
+    monkeypatch.setattr(orchestrator.settings, "RUN_STREAMING", True)
+    monkeypatch.setattr(orchestrator, "stream_run", stream_run)
+
+
+def use_poll_run(monkeypatch, polled, result):
+    async def poll_run(thread_id, run_id, session, deadline, emit=None):
+        polled.append(run_id)
+        return result
+
+    monkeypatch.setattr(orchestrator, "poll_run", poll_run)
+
+
+def recorder():
+    events = []
+
+    async def emit(name, data):
+        events.append((name, data))
+
+    return events, emit
+
+
+def test_broken_stream_falls_back_to_polling_the_same_run(monkeypatch):
+    runs, polled = FakeRuns(), []
+    use_client(monkeypatch, runs=runs)
+    run = SimpleNamespace(id="run_1", status="requires_action")
+    outputs = [{"tool_call_id": "call_1", "output": "{}"}]
+    use_stream_run(monkeypatch, run=run, pending_outputs=outputs)
+    use_poll_run(monkeypatch, polled, SimpleNamespace(id="run_1", status="completed"))
+    events, emit = recorder()
+
+    result = asyncio.run(execute_run("thread_1", "asst_1", {}, emit=emit))
+
+    assert result.status == "completed"
+    assert ("stream_reset", None) in events
+    # Outputs computed before the stream broke are submitted, not recomputed, and no new run is started
+    assert runs.submitted == [("run_1", outputs)]
+    assert runs.created == []
+    assert polled == ["run_1"]
+
+
+def test_stream_that_never_opened_starts_a_polled_run(monkeypatch):
+    runs, polled = FakeRuns(), []
+    use_client(monkeypatch, runs=runs)
+    use_stream_run(monkeypatch)
+    use_poll_run(monkeypatch, polled, SimpleNamespace(id="run_new", status="completed"))
+
+    result = asyncio.run(execute_run("thread_1", "asst_1", {}))
+
+    assert result.status == "completed"
+    assert runs.created == ["asst_1"]
+    assert polled == ["run_new"]
+
+
+def test_run_timeout_cancels_the_run(monkeypatch):
+    runs, polled = FakeRuns(), []
+    use_client(monkeypatch, runs=runs)
+    use_stream_run(monkeypatch, run=SimpleNamespace(id="run_1", status="in_progress"), error=RunTimeout())
+    use_poll_run(monkeypatch, polled, None)
+
+    assert asyncio.run(execute_run("thread_1", "asst_1", {})) is None
+    assert runs.cancelled == ["run_1"]
+    assert polled == []
+
+
+def test_reply_stream_discards_partial_text_after_a_reset(monkeypatch):
+    use_client(monkeypatch, messages=FakeMessages("The full answer."))
+    events, emit = recorder()
+
+    async def scenario():
+        reply = ReplyStream(emit=emit)
+        await reply.on_event("message_start", None)
+        await reply.on_event("text_delta", "The fu")
+        await reply.on_event("stream_reset", None)
+        return await reply.result("thread_1")
+
+    text, image_url = asyncio.run(scenario())
+
+    assert (text, image_url) == ("The full answer.", None)
+    assert events == [
+        ("delta", {"text": "The fu"}),
+        ("reset", None),
+        ("delta", {"text": "The full answer."}),
+    ]
+
+
+def test_reply_stream_keeps_streamed_text(monkeypatch):
+    use_client(monkeypatch, messages=FakeMessages("unused"))
+    events, emit = recorder()
+
+    async def scenario():
+        reply = ReplyStream(emit=emit)
+        await reply.on_event("message_start", None)
+        for delta in ["Check the ", "oil [lev", "el."]:
+            await reply.on_event("text_delta", delta)
+        return await reply.result("thread_1")
+
+    assert asyncio.run(scenario()) == ("Check the oil [level.", None)
+    assert "".join(data["text"] for name, data in events if name == "delta") == "Check the oil [level."